@@ -0,0 +1,249 @@
+"""
+Benchmark suite.
+
+Times the hot paths of a round without a window (SDL's dummy video driver):
+the math helpers, puzzle generation per difficulty, stage 2's exponent
+choices, the encrypt / decrypt loops, one logic tick and one frame at
+several snake lengths, and the game's cold start in a fresh interpreter.
+Each case reports the median of several timeit runs per operation; results
+can be written as JSON and compared with a baseline. The baseline is not
+part of the repository: record one on the machine you check on, since the
+comparison is informational unless --check asks for a failing exit on
+regressions, and that only means something against a local baseline.
+
+    python bench.py                                   # run and compare with bench_baseline.json
+    python bench.py --filter tick --output now.json
+    python bench.py --save-baseline                   # record this machine's baseline
+    python bench.py --check                           # exit 1 if a case got slower than the tolerance
+"""
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+import rsa_engine
+import rsa_math
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+SNAKE_LENGTHS = (1, 32, 128, 400)   # The board has COLS * ROWS = 600 cells.
+REPEAT = 15
+TOLERANCE = 0.25   # A case more than 25% slower than its baseline is a regression.
+SEED = 2024
+
+# -------------------------------------------------------------------
+# Cases: each builder returns {name: zero-argument callable}.
+
+def math_cases():
+    cases = {}
+    for difficulty in DIFFICULTIES:
+        bundle = rsa_engine.seeded_key_bundle(difficulty, SEED)
+        p, q = bundle.primes
+        e = bundle.valid_e[0]
+        d = bundle.d[e]
+        food_count = rsa_engine.food_count_for(difficulty)
+        rng = random.Random(SEED)
+        word = rsa_engine.VALID_WORDS[0]
+        encrypted = rsa_math.encrypt_message(word, e, bundle.n)
+        crt = bundle.crt[e]
+        cases[f"is_prime[{difficulty}]"] = lambda p=p, rng=rng: rsa_math.is_prime(p, rng)
+        cases[f"generate_numbers[{difficulty}]"] = lambda difficulty=difficulty, rng=rng: \
+            rsa_math.generate_numbers(difficulty, rng)
+        cases[f"exponent_options[{difficulty}]"] = lambda p=p, q=q, food_count=food_count, rng=rng: \
+            rsa_engine.exponent_options(p, q, food_count, rng)
+        cases[f"extended_gcd[{difficulty}]"] = lambda e=e, phi=bundle.phi: rsa_math.extended_gcd(e, phi)
+        cases[f"mod_inverse[{difficulty}]"] = lambda e=e, phi=bundle.phi: rsa_math.mod_inverse(e, phi)
+        cases[f"encrypt[{difficulty}]"] = lambda e=e, n=bundle.n: rsa_math.encrypt_message(word, e, n)
+        cases[f"decrypt[{difficulty}]"] = lambda d=d, n=bundle.n, crt=crt: \
+            rsa_math.decrypt_message(encrypted, d, n, crt)
+    return cases
+
+def long_stage(length, rng):
+    """A stage 1 state whose snake has `length` cells, heading off with the autopilot."""
+    bundle = rsa_engine.seeded_key_bundle("medium", SEED)
+    snake = rsa_engine.Snake()
+    for index in rsa_engine.centered_cells(length):
+        snake.cells.append(index)
+        snake.occupied[index] = 1
+    return rsa_engine.Stage1(snake, "medium", rng, bundle)
+
+def tick(stage, length=None):
+    """One logic tick as the game runs it: input, then the stage rules. With
+       `length`, food does not grow the snake, so every tick sees the same length."""
+    for direction in rsa_engine.autopilot(stage):
+        stage.turn(direction)
+    if stage.direction is None:
+        stage.turn(rsa_engine.UP)
+    outcome = stage.step()
+    if outcome == rsa_engine.CRASHED:
+        stage.reset()
+    elif outcome == rsa_engine.CLEARED:
+        stage.result = None
+        stage.primes_collected = []
+    if length is not None and len(stage.snake) > length:
+        tail = stage.snake.pop_tail()
+        stage.free.add(tail)
+        stage.dirty_cells.add(tail)
+    return outcome
+
+def tick_cases():
+    cases = {}
+    for length in SNAKE_LENGTHS:
+        stage = long_stage(length, random.Random(SEED))
+        cases[f"tick[len={length}]"] = lambda stage=stage, length=length: tick(stage, length)
+    return cases
+
+def frame_cases():
+    import pygame
+    import rsa_game
+    rsa_game.init_display()
+
+    def full_frame(stage, info):
+        rsa_game.screen.fill(rsa_game.BLACK)
+        rsa_game.draw_info_section(info)
+        rsa_game.draw_snake(stage.snake)
+        rsa_game.draw_food(stage.food_positions, stage.food_values)
+        rsa_game.draw_button_bar()
+        pygame.display.flip()
+
+    def dirty_frame(stage, length):
+        tick(stage, length)
+        rsa_game.draw_stage(stage, rsa_game.stage1_info(stage, 12.3))
+
+    cases = {}
+    for length in SNAKE_LENGTHS:
+        stage = long_stage(length, random.Random(SEED))
+        info = rsa_game.stage1_info(stage, 12.3)
+        cases[f"frame_full[len={length}]"] = lambda stage=stage, info=info: full_frame(stage, info)
+        dirty = long_stage(length, random.Random(SEED))
+        rsa_game.request_full_redraw()
+        rsa_game.draw_stage(dirty, rsa_game.stage1_info(dirty, 12.3))
+        cases[f"tick_and_dirty_frame[len={length}]"] = lambda stage=dirty, length=length: dirty_frame(stage, length)
+    return cases
+
+def start_python(code):
+    """Run `code` in a fresh interpreter with the dummy SDL drivers."""
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def startup_cases():
+    """Cold start: importing rsa_game must stay cheap (no window, no fonts);
+       init_display() is the one place that pays for pygame setup."""
+    return {
+        "startup[python]": lambda: start_python("pass"),
+        "startup[import pygame]": lambda: start_python("import pygame"),
+        "startup[import rsa_game]": lambda: start_python("import rsa_game"),
+        "startup[init_display]": lambda: start_python("import rsa_game; rsa_game.init_display()"),
+    }
+
+CASE_GROUPS = (math_cases, tick_cases, frame_cases, startup_cases)
+
+# -------------------------------------------------------------------
+# Running and comparing
+
+def measure(function, repeat=REPEAT):
+    """Median seconds per call over `repeat` runs of timeit's auto-ranged loop."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return statistics.median(timer.repeat(repeat, number)) / number, number
+
+def run(pattern=None, repeat=REPEAT, out=sys.stdout):
+    random.seed(SEED)
+    results = {}
+    for group in CASE_GROUPS:
+        for name, function in group().items():
+            if pattern and pattern not in name:
+                continue
+            seconds, number = measure(function, repeat)
+            results[name] = {"seconds": seconds, "number": number}
+            print(f"{name:36} {format_time(seconds):>12}   ({number} x {repeat})", file=out)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "results": results,
+    }
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def compare(report, baseline, tolerance=TOLERANCE, out=sys.stdout):
+    """Print current / baseline per case; returns the names that regressed."""
+    regressions = []
+    print(f"\nAgainst the baseline from {baseline.get('created', '?')} ({baseline.get('machine', '?')}):", file=out)
+    if (baseline.get("machine"), baseline.get("python")) != (report["machine"], report["python"]):
+        print(f"Warning: the baseline was recorded on {baseline.get('machine', '?')} with Python "
+              f"{baseline.get('python', '?')}; this run is {report['machine']} with Python "
+              f"{report['python']}, so the ratios say little. Record a local one with --save-baseline.",
+              file=out)
+    for name, result in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:36} {'new':>12}", file=out)
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + tolerance):
+            flag = "  faster"
+        print(f"{name:36} {ratio:11.2f}x{flag}", file=out)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RSA Snake's math, logic ticks and frames.")
+    parser.add_argument("--filter", default=None, help="only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed slowdown before a case counts as a regression (0.25 = 25%%)")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with status 1 if any case regressed (use a baseline from this machine)")
+    args = parser.parse_args(argv)
+
+    report = run(args.filter, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        if args.filter and os.path.exists(args.baseline):
+            # A filtered run only replaces its own cases in the stored baseline.
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            stored["results"].update(report["results"])
+            report = dict(report, results=stored["results"])
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Per-frame phase profiling.
+
+The game loop marks the end of each phase of a frame (event pump, input,
+logic ticks, info panel, board, display flip, clock sleep), and times the
+start of each round (key bundle wait, stage 1 setup) as a "transition"
+frame of its own; the time since
+the previous mark goes into that phase's histogram. Histograms have fixed
+log-spaced buckets, so recording is a bisect and two additions, and a
+disabled Profiler returns from mark() at once.
+
+Enable it with the game's --profile flag or RSA_SNAKE_PROFILE=1;
+RSA_SNAKE_PROFILE_DUMP=path (or --profile-dump) rewrites a JSON, or with a
+.prom suffix Prometheus text, snapshot every DUMP_INTERVAL seconds.
+
+    python frameprof.py profile.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+
+# Upper bucket bounds in seconds (Prometheus "le"); the last bucket is +Inf.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0)
+DUMP_INTERVAL = 10.0   # Seconds between periodic dumps.
+SPIKE_SECONDS = 0.05   # Frames slower than this are counted as spikes.
+SMOOTHING = 0.05       # Weight of the newest sample in the overlay's moving average.
+ENV_ENABLE = "RSA_SNAKE_PROFILE"
+ENV_DUMP = "RSA_SNAKE_PROFILE_DUMP"
+
+class Histogram:
+    """Counts of samples per bucket, plus their sum, max and a moving average."""
+
+    __slots__ = ("counts", "count", "sum", "max", "average")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.average = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if self.count == 1:
+            self.average = seconds
+        else:
+            self.average += (seconds - self.average) * SMOOTHING
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99), "buckets": list(self.counts)}
+
+class Profiler:
+    """Phase timings of the frames between begin_frame() and end_frame().
+
+    mark(phase) charges the time since the previous mark (or begin_frame) to
+    `phase`. discard() drops the rest of the current frame, e.g. after a
+    blocking overlay such as the leaderboard.
+    """
+
+    def __init__(self, enabled=False, dump_path=None, dump_interval=DUMP_INTERVAL,
+                 spike_seconds=SPIKE_SECONDS, clock=time.perf_counter):
+        self.enabled = enabled
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.spike_seconds = spike_seconds
+        self.clock = clock
+        self.phases = {}   # phase name -> Histogram, in first-seen order
+        self.frame = Histogram()
+        self.spikes = 0
+        self._current = {}
+        self._frame_start = None
+        self._last = None
+        self._next_dump = time.monotonic() + dump_interval
+
+    @classmethod
+    def from_environment(cls, enabled=False, dump_path=None):
+        """A Profiler switched on by the flag or RSA_SNAKE_PROFILE, dumping to the
+           flag's path or RSA_SNAKE_PROFILE_DUMP."""
+        dump_path = dump_path or os.environ.get(ENV_DUMP) or None
+        enabled = enabled or bool(dump_path) or os.environ.get(ENV_ENABLE, "") not in ("", "0")
+        return cls(enabled, dump_path)
+
+    def begin_frame(self):
+        if self.enabled:
+            self._frame_start = self._last = self.clock()
+            self._current = {}
+
+    def mark(self, phase):
+        if self._last is None:
+            return
+        now = self.clock()
+        self._current[phase] = self._current.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def discard(self):
+        self._last = None
+
+    def end_frame(self):
+        if self._last is None:
+            return
+        total = self._last - self._frame_start
+        self._last = None
+        for phase, seconds in self._current.items():
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = Histogram()
+            histogram.observe(seconds)
+        self.frame.observe(total)
+        if total > self.spike_seconds:
+            self.spikes += 1
+        if self.dump_path and time.monotonic() >= self._next_dump:
+            self.dump()
+
+    # Export
+
+    def snapshot(self):
+        return {"time": time.time(), "frames": self.frame.count, "spikes": self.spikes,
+                "spike_seconds": self.spike_seconds, "buckets": list(BUCKETS),
+                "frame": self.frame.to_dict(),
+                "phases": {phase: histogram.to_dict() for phase, histogram in self.phases.items()}}
+
+    def to_prometheus(self):
+        lines = ["# HELP rsa_snake_frame_phase_seconds Time spent in each phase of a frame.",
+                 "# TYPE rsa_snake_frame_phase_seconds histogram"]
+        series = [(f'phase="{phase}"', histogram) for phase, histogram in self.phases.items()]
+        series.append(('phase="total"', self.frame))
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'rsa_snake_frame_phase_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"rsa_snake_frame_phase_seconds_sum{{{labels}}} {histogram.sum!r}")
+            lines.append(f"rsa_snake_frame_phase_seconds_count{{{labels}}} {histogram.count}")
+        lines += ["# HELP rsa_snake_frame_spikes_total Frames slower than the spike threshold.",
+                  "# TYPE rsa_snake_frame_spikes_total counter",
+                  f"rsa_snake_frame_spikes_total {self.spikes}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=None):
+        """Write the snapshot (Prometheus text for a .prom path, else JSON), atomically."""
+        path = path or self.dump_path
+        self._next_dump = time.monotonic() + self.dump_interval
+        text = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.snapshot(), indent=2)
+        try:
+            with open(path + ".tmp", "w") as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            print(f"Could not write the frame profile: {error}")
+
+    def overlay_lines(self):
+        """Short per-phase lines for an on-screen overlay: average, p99 and max in ms."""
+        lines = [f"frame {self.frame.average * 1000:5.1f} p99 {self.frame.quantile(0.99) * 1000:5.1f} "
+                 f"spikes {self.spikes}"]
+        for phase, histogram in self.phases.items():
+            lines.append(f"{phase:7} {histogram.average * 1000:5.2f} p99 {histogram.quantile(0.99) * 1000:5.1f} "
+                         f"max {histogram.max * 1000:5.0f}")
+        return lines
+
+    def report(self):
+        return f"Frame profile: {self.frame.count} frames, {self.spikes} spikes" + (
+            f", p99 {self.frame.quantile(0.99) * 1000:.1f} ms" if self.frame.count else "")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a JSON frame profile dump.")
+    parser.add_argument("file")
+    args = parser.parse_args(argv)
+    with open(args.file) as f:
+        snapshot = json.load(f)
+    print(f"{snapshot['frames']} frames, {snapshot['spikes']} slower than {snapshot['spike_seconds'] * 1000:.0f} ms")
+    print(f"{'phase':8} {'count':>8} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rows = list(snapshot["phases"].items()) + [("total", snapshot["frame"])]
+    for phase, stats in rows:
+        mean = stats["sum"] / stats["count"] if stats["count"] else 0.0
+        print(f"{phase:8} {stats['count']:8} {mean * 1000:9.3f} {stats['p50'] * 1000:8.2f} "
+              f"{stats['p99'] * 1000:8.2f} {stats['max'] * 1000:8.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Background prefetch of round key material.
+
+A KeyPool keeps a bounded queue of ready KeyBundles (numbers, p, q, n, φ(n),
+the stage 2 exponent choices and their d values) per difficulty, built by
+worker processes so big keys never stall the render loop. Taking a bundle
+immediately queues its replacement.
+
+    python keypool.py --difficulty expert --rounds 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import rsa_engine
+
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+POOL_DEPTH = 4          # Ready bundles kept per difficulty.
+EXPERT_POOL_DEPTH = 2   # Expert keys take seconds each; keep fewer around.
+
+def worker_context():
+    """Start workers from a fork server (or spawn them where there is none):
+       the game starts its pool after the window and the score client thread
+       exist, and a plain fork would copy that state into every worker."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def _build(difficulty, seed):
+    """Worker entry point. Each task gets its own seed so workers never
+       share (and repeat) one random state."""
+    return rsa_engine.seeded_key_bundle(difficulty, seed)
+
+class KeyPool:
+    """Bounded per-difficulty queues of KeyBundles, refilled by a process pool."""
+
+    def __init__(self, difficulties=DIFFICULTIES, depth=POOL_DEPTH,
+                 expert_depth=EXPERT_POOL_DEPTH, workers=None):
+        self.depths = {d: (expert_depth if d == "expert" else depth) for d in difficulties}
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self._executor = None
+        self._lock = threading.RLock()
+        self._ready = {d: deque() for d in difficulties}
+        self._pending = {d: deque() for d in difficulties}   # Futures in build order.
+        self.served = {d: 0 for d in difficulties}
+        self.empty = {d: 0 for d in difficulties}
+
+    def start(self):
+        """Start the workers and begin filling every queue."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=worker_context())
+            for difficulty in self.depths:
+                self._refill(difficulty)
+        return self
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _refill(self, difficulty):
+        with self._lock:
+            missing = self.depths[difficulty] - len(self._ready[difficulty]) - len(self._pending[difficulty])
+            for _ in range(missing):
+                future = self._executor.submit(_build, difficulty, random.getrandbits(64))
+                self._pending[difficulty].append(future)
+                future.add_done_callback(lambda f, d=difficulty: self._finished(d, f))
+
+    def _finished(self, difficulty, future):
+        with self._lock:
+            if future in self._pending[difficulty]:
+                self._pending[difficulty].remove(future)
+                if not future.cancelled() and future.exception() is None:
+                    self._ready[difficulty].append(future.result())
+
+    def take(self, difficulty):
+        """Return a Future for the next bundle. It is already done unless the
+           queue ran empty, in which case it resolves when the oldest pending
+           build finishes (counted in `empty`)."""
+        if self._executor is None:
+            self.start()
+        with self._lock:
+            self.served[difficulty] += 1
+            if self._ready[difficulty]:
+                future = Future()
+                future.set_result(self._ready[difficulty].popleft())
+            else:
+                self.empty[difficulty] += 1
+                if self._pending[difficulty]:
+                    # Claim the oldest build so it is not also queued as ready.
+                    future = self._pending[difficulty].popleft()
+                else:
+                    future = self._executor.submit(_build, difficulty, random.getrandbits(64))
+        self._refill(difficulty)
+        return future
+
+    def stats(self):
+        """Per difficulty: bundles served, times the queue was empty, and
+           bundles ready / being built right now."""
+        with self._lock:
+            return {d: {"served": self.served[d], "empty": self.empty[d],
+                        "ready": len(self._ready[d]), "pending": len(self._pending[d])}
+                    for d in self.depths}
+
+    def report(self):
+        lines = []
+        for difficulty, stat in self.stats().items():
+            if stat["served"]:
+                rate = 100.0 * stat["empty"] / stat["served"]
+                lines.append(f"{difficulty}: served {stat['served']}, "
+                             f"ran empty {stat['empty']} ({rate:.0f}%)")
+        return "Key pool: " + ("; ".join(lines) if lines else "no rounds served")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exercise the key prefetch pool.")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default="expert")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--round-seconds", type=float, default=1.0,
+                        help="simulated play time between takes")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    pool = KeyPool(difficulties=(args.difficulty,), workers=args.workers).start()
+    try:
+        for i in range(args.rounds):
+            began = time.perf_counter()
+            bundle = pool.take(args.difficulty).result()
+            waited = time.perf_counter() - began
+            print(f"round {i + 1}: n has {bundle.n.bit_length()} bits, waited {waited * 1000:.1f} ms")
+            time.sleep(args.round_seconds)
+        print(pool.report())
+    finally:
+        pool.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
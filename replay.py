@@ -0,0 +1,245 @@
+"""
+Compact binary replays.
+
+A round is reproducible from its difficulty, the seed of its key bundle and
+the seed of its stage RNG; the only other input is the direction the snake
+takes on each logic tick. ReplayRecorder stores that as a 2-bit code per
+tick (keep going, turn clockwise, turn counter-clockwise, or an escape
+followed by an absolute direction), plus the button commands pressed, so a
+minute of play costs about 150 bytes. ReplayPlayer feeds the codes back into
+a fresh Round one tick at a time, at whatever pace the caller likes.
+
+    python replay.py record --difficulty hard --seed 7 -o round.rsr
+    python replay.py verify round.rsr replays/*.rsr
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+import rsa_engine
+from rsa_engine import UP, DOWN, LEFT, RIGHT
+
+MAGIC = b"RSRP"
+VERSION = 1
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replays")
+
+# Per-tick codes.
+KEEP, CLOCKWISE, COUNTER_CLOCKWISE, ABSOLUTE = range(4)
+COMPASS = (UP, RIGHT, DOWN, LEFT)
+COMPASS_INDEX = {direction: i for i, direction in enumerate(COMPASS)}
+
+# Button commands (they never change the logic, but are part of the record).
+COMMANDS = ("pause", "resume", "restart", "main", "newplayer", "leaderboard")
+COMMAND_CODES = {name: code for code, name in enumerate(COMMANDS)}
+
+NUMBERS = struct.Struct("<BQQdIIB")   # has bundle seed, bundle seed, round seed, tick ms, ticks, claimed ms, completed
+COMMAND = struct.Struct("<IB")        # tick, command code
+COUNT = struct.Struct("<I")
+
+def _pack_text(text):
+    data = text.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+def _unpack_text(data, offset):
+    (length,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+class ReplayRecorder:
+    """Collects one round's tick codes and commands (see Round's `recorder`)."""
+
+    def __init__(self, difficulty, round_seed, bundle_seed=None, tick_ms=rsa_engine.TICK_MS, player=""):
+        self.difficulty = difficulty
+        self.round_seed = round_seed
+        self.bundle_seed = bundle_seed
+        self.tick_ms = tick_ms
+        self.player = player
+        self.ticks = 0
+        self.commands = []          # (tick, code)
+        self.codes = bytearray()    # Four 2-bit codes per byte, first tick in the low bits.
+        self._byte = 0
+        self._bits = 0
+
+    def _write(self, code):
+        self._byte |= code << self._bits
+        self._bits += 2
+        if self._bits == 8:
+            self.codes.append(self._byte)
+            self._byte = self._bits = 0
+
+    def tick(self, before, after):
+        """One logic tick: the stage direction after the previous tick and the one used now."""
+        self.ticks += 1
+        if after == before:
+            self._write(KEEP)
+            return
+        if before is not None:
+            turn = (COMPASS_INDEX[after] - COMPASS_INDEX[before]) % 4
+            if turn == 1:
+                self._write(CLOCKWISE)
+                return
+            if turn == 3:
+                self._write(COUNTER_CLOCKWISE)
+                return
+        self._write(ABSOLUTE)
+        self._write(COMPASS_INDEX[after])
+
+    def command(self, name):
+        self.commands.append((self.ticks, COMMAND_CODES[name]))
+
+    def to_bytes(self, claimed_ms=0, completed=False):
+        codes = bytes(self.codes) + (bytes([self._byte]) if self._bits else b"")
+        parts = [MAGIC, bytes([VERSION]), _pack_text(self.difficulty), _pack_text(self.player),
+                 NUMBERS.pack(self.bundle_seed is not None, self.bundle_seed or 0, self.round_seed,
+                              self.tick_ms, self.ticks, int(claimed_ms), completed),
+                 COUNT.pack(len(self.commands))]
+        parts.extend(COMMAND.pack(tick, code) for tick, code in self.commands)
+        parts.append(COUNT.pack(len(codes)))
+        parts.append(codes)
+        return b"".join(parts)
+
+    def save(self, path, claimed_ms=0, completed=False):
+        return write(path, self.to_bytes(claimed_ms, completed))
+
+class Replay:
+    """A parsed replay file."""
+
+    def __init__(self, data):
+        if data[:4] != MAGIC or data[4] != VERSION:
+            raise ValueError("not an RSA Snake replay (or an unsupported version)")
+        self.difficulty, offset = _unpack_text(data, 5)
+        self.player, offset = _unpack_text(data, offset)
+        (has_bundle, bundle_seed, self.round_seed, self.tick_ms, self.ticks,
+         self.claimed_ms, completed) = NUMBERS.unpack_from(data, offset)
+        offset += NUMBERS.size
+        self.bundle_seed = bundle_seed if has_bundle else None
+        self.completed = bool(completed)
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        self.commands = []
+        for _ in range(count):
+            tick, code = COMMAND.unpack_from(data, offset)
+            self.commands.append((tick, COMMANDS[code]))
+            offset += COMMAND.size
+        (length,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        self.codes = data[offset:offset + length]
+        if len(self.codes) != length or self._codes_needed() != length:
+            raise ValueError(f"code stream of {len(self.codes)} bytes does not hold {self.ticks} ticks")
+
+    def _codes_needed(self):
+        """Bytes a stream holding exactly `ticks` ticks takes, or -1 if this one runs out."""
+        stream = self.code_stream()
+        needed = 0
+        for _ in range(self.ticks):
+            code = next(stream, None)
+            if code == ABSOLUTE:
+                code = next(stream, None)
+                needed += 1
+            if code is None:
+                return -1
+            needed += 1
+        return (needed + 3) // 4
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def code_stream(self):
+        for byte in self.codes:
+            yield byte & 3
+            yield (byte >> 2) & 3
+            yield (byte >> 4) & 3
+            yield byte >> 6
+
+class ReplayPlayer:
+    """Replays a round tick by tick: step() applies the recorded direction and
+    advances the Round. The caller decides the pace."""
+
+    def __init__(self, replay, bundle=None):
+        self.replay = replay
+        if bundle is None and replay.bundle_seed is not None:
+            bundle = rsa_engine.seeded_key_bundle(replay.difficulty, replay.bundle_seed)
+        self.round = rsa_engine.Round(replay.difficulty, random.Random(replay.round_seed), bundle)
+        self._codes = replay.code_stream()
+
+    @property
+    def finished(self):
+        return self.round.ticks >= self.replay.ticks or self.round.completed
+
+    def step(self):
+        code = next(self._codes)
+        stage = self.round.stage
+        before = stage.direction
+        if code == CLOCKWISE:
+            stage.direction = COMPASS[(COMPASS_INDEX[before] + 1) % 4]
+        elif code == COUNTER_CLOCKWISE:
+            stage.direction = COMPASS[(COMPASS_INDEX[before] - 1) % 4]
+        elif code == ABSOLUTE:
+            stage.direction = COMPASS[next(self._codes)]
+        return self.round.step()
+
+    def run(self):
+        while not self.finished:
+            self.step()
+        return self.round
+
+def matches(replay, game_round):
+    """The replayed round ended exactly as recorded (and, if completed, decrypted correctly)."""
+    return (game_round.ticks == replay.ticks and game_round.completed == replay.completed
+            and (game_round.verified or not replay.completed))
+
+def verify(replay, bundle=None):
+    """Replay a whole round and check it against the recording."""
+    return matches(replay, ReplayPlayer(replay, bundle).run())
+
+def write(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def replay_path(player, directory=None):
+    directory = directory or REPLAY_DIR
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in player) or "player"
+    return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}-{random.getrandbits(24):06x}.rsr")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record or verify RSA Snake replays.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="play an autopilot round headless and save it")
+    record_parser.add_argument("--difficulty", choices=("easy", "medium", "hard", "expert"), default="easy")
+    record_parser.add_argument("--seed", type=int, default=None)
+    record_parser.add_argument("-o", "--output", required=True)
+    verify_parser = commands.add_parser("verify", help="replay files and check they end as recorded")
+    verify_parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        rng = random.Random(args.seed)
+        round_seed, bundle_seed = rng.getrandbits(64), rng.getrandbits(64)
+        recorder = ReplayRecorder(args.difficulty, round_seed, bundle_seed, player="autopilot")
+        bundle = rsa_engine.seeded_key_bundle(args.difficulty, bundle_seed)
+        result = rsa_engine.run_round(args.difficulty, rsa_engine.autopilot, rng=random.Random(round_seed),
+                                      bundle=bundle, recorder=recorder)
+        recorder.save(args.output, result.elapsed_ms, result.completed)
+        print(f"{result.ticks} ticks, {len(recorder.to_bytes())} bytes -> {args.output}")
+        return 0
+
+    failed = 0
+    for path in args.files:
+        replay = Replay.load(path)
+        began = time.perf_counter()
+        ok = verify(replay)
+        failed += not ok
+        print(f"{path}: {'ok' if ok else 'MISMATCH'} ({replay.player}, {replay.difficulty}, "
+              f"{replay.ticks} ticks, {(time.perf_counter() - began) * 1000:.1f} ms)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
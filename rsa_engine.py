@@ -0,0 +1,754 @@
+"""
+Display-free RSA Snake rules.
+
+The stage rules (snake movement, food eating, prime / e / letter / n-d
+selection and collision handling) live here so that the pygame front end in
+rsa_game.py and the headless simulator below drive exactly the same game.
+Nothing in this module touches pygame.
+
+Headless usage:
+    python rsa_engine.py --rounds 5000 --difficulty hard
+
+On CPython 3.11 this plays several hundred autopilot rounds a second on one
+core (roughly 700-900 easy, 500 hard; about 100-150k ticks/s), and over
+half of that time is the greedy bot rather than the rules.
+"""
+
+import argparse
+import random
+import sys
+import time
+from collections import deque
+from itertools import compress
+
+from rsa_math import generate_numbers, prime_factors, batch_mod_inverse, crt_params, encrypt_message, decrypt_message
+
+# Playing area and grid settings (pixels, without the info panel / button bar).
+WIDTH, HEIGHT = 600, 400
+GRID_SIZE = 20
+COLS, ROWS = WIDTH // GRID_SIZE, HEIGHT // GRID_SIZE
+TICK_MS = 100          # One logic tick at the original 10 FPS.
+MAX_CATCH_UP_TICKS = 5 # Most logic ticks one frame may run after a stall.
+PACK_MESSAGES = True   # Pack several plaintext bytes per RSA block when n is wide enough.
+
+# Directions
+UP    = (0, -1)
+DOWN  = (0, 1)
+LEFT  = (-1, 0)
+RIGHT = (1, 0)
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+OPPOSITE = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}
+
+# Outcomes of StageState.step().
+MOVED = "moved"
+ATE = "ate"
+CRASHED = "crashed"
+CLEARED = "cleared"
+
+VALID_WORDS = [
+    "HELLO", "WORLD", "APPLE", "BANANA", "ORANGE", "PEACH",
+    "MANGO", "CHERRY", "LEMON", "PYTHON", "COMPUTER", "KEYBOARD"
+]
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Stage 2 offers EXPONENT_CHOICES valid e below EXPONENT_LIMIT; distractors
+# come from [φ - 100, φ + 10].
+EXPONENT_CHOICES = 3
+EXPONENT_LIMIT = 1000
+INVALID_WINDOW = (100, 10)
+MAX_WINDOW_WIDENINGS = 8   # φ is even, so one widening already holds dozens of distractors.
+
+# -------------------------------------------------------------------
+# Board helpers
+
+def food_count_for(difficulty):
+    """7 food tiles for medium/hard/expert, 4 for easy."""
+    return 7 if difficulty in ("medium", "hard", "expert") else 4
+
+def cell_index(pos):
+    """Pixel position -> row-major cell index."""
+    return (pos[1] // GRID_SIZE) * COLS + pos[0] // GRID_SIZE
+
+def cell_position(index):
+    """Cell index -> pixel position of its top-left corner."""
+    row, col = divmod(index, COLS)
+    return (col * GRID_SIZE, row * GRID_SIZE)
+
+# (col, row) of every cell, and per direction the cell one step away (-1 off
+# the board), so a tick never divides or bounds-checks.
+CELL_COORDS = [(index % COLS, index // COLS) for index in range(COLS * ROWS)]
+CELL_STEPS = {direction: [(row + direction[1]) * COLS + col + direction[0]
+                          if 0 <= col + direction[0] < COLS and 0 <= row + direction[1] < ROWS
+                          else -1
+                          for col, row in CELL_COORDS]
+              for direction in DIRECTIONS}
+
+class Snake:
+    """Snake body as a deque of cell indices (head first) plus an occupancy
+       bitmap, so moving, growing and self-collision checks are O(1) at any length.
+
+    Iterating yields pixel positions, head first, for code that still thinks
+    in pixels.
+    """
+
+    __slots__ = ("cells", "occupied")
+
+    def __init__(self, positions=()):
+        self.cells = deque()
+        self.occupied = bytearray(COLS * ROWS)
+        for pos in positions:
+            index = cell_index(pos)
+            self.cells.append(index)
+            self.occupied[index] = 1
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return map(cell_position, self.cells)
+
+    def __contains__(self, pos):
+        return self.occupied[cell_index(pos)] == 1
+
+    @property
+    def head(self):
+        return cell_position(self.cells[0])
+
+    def push_head(self, index):
+        self.cells.appendleft(index)
+        self.occupied[index] = 1
+
+    def pop_tail(self):
+        index = self.cells.pop()
+        self.occupied[index] = 0
+        return index
+
+    def recenter(self):
+        """Move the snake back to the center in place, preserving its length."""
+        length = len(self.cells)
+        for index in self.cells:
+            self.occupied[index] = 0
+        self.cells.clear()
+        for index in centered_cells(length):
+            self.cells.append(index)
+            self.occupied[index] = 1
+
+class FreeCells:
+    """The empty cells of the board (no snake, no food) as an indexable set:
+       add, remove and pop_random are all O(1), so food spawning never has to
+       retry however long the snake gets."""
+
+    __slots__ = ("cells", "slots")
+
+    def __init__(self, snake):
+        self.cells = list(range(COLS * ROWS))
+        self.slots = list(range(COLS * ROWS))   # cell index -> position in self.cells
+        for index in snake.cells:
+            self.remove(index)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, index):
+        return self.slots[index] >= 0
+
+    def add(self, index):
+        self.slots[index] = len(self.cells)
+        self.cells.append(index)
+
+    def remove(self, index):
+        slot = self.slots[index]
+        last = self.cells.pop()
+        if last != index:
+            self.cells[slot] = last
+            self.slots[last] = slot
+        self.slots[index] = -1
+
+    def pop_random(self, rng=random):
+        index = self.cells[rng.randrange(len(self.cells))]
+        self.remove(index)
+        return index
+
+def initial_snake():
+    return Snake([(WIDTH // 2, HEIGHT // 2)])
+
+def centered_cells(length):
+    """Cell indices for a snake of `length` placed in the center, head first.
+       The body runs left from the center; a snake too long for that row
+       folds back and forth on the rows below instead of leaving the board."""
+    col, row = COLS // 2, ROWS // 2
+    step = -1
+    for _ in range(length):
+        yield row * COLS + col
+        if not 0 <= col + step < COLS:
+            row, step = (row + 1) % ROWS, -step
+        else:
+            col += step
+
+# -------------------------------------------------------------------
+# Key material
+
+def exponent_pools(p, q, food_count):
+    """Return (valid, invalid): every stage 2 exponent in [3, min(φ, EXPONENT_LIMIT))
+    coprime with φ = (p - 1)(q - 1), and every number in the INVALID_WINDOW
+    around φ that shares a factor with it.
+
+    φ is factored once from p - 1 and q - 1; only its primes below
+    EXPONENT_LIMIT can divide an offered exponent, so both lists are built by
+    crossing off multiples of those primes, with no gcd calls and no
+    rejection loops. The window is widened upwards (a bounded number of
+    times, since every other number is even) until it holds food_count - 1
+    distractors.
+    """
+    valid, invalid, _ = _exponent_pools(p, q, food_count)
+    return valid, invalid
+
+def _exponent_pools(p, q, food_count):
+    """exponent_pools plus the number of times the invalid window was widened."""
+    phi = (p - 1) * (q - 1)
+    upper = min(phi, EXPONENT_LIMIT)
+    factors = sorted(set(prime_factors(p - 1, upper) + prime_factors(q - 1, upper)))
+    if not factors:
+        raise ValueError(f"φ = {phi} has no prime factor to build invalid exponents from")
+
+    coprime = bytearray([1]) * max(upper, 0)
+    for f in factors:
+        coprime[::f] = bytes(len(range(0, upper, f)))
+    valid = [e for e in compress(range(upper), coprime) if e >= 3]
+
+    below, above = INVALID_WINDOW
+    low, high = max(2, phi - below), phi + above
+    for widenings in range(MAX_WINDOW_WIDENINGS + 1):
+        shared = bytearray(high - low + 1)
+        for f in factors:
+            first = -(-low // f) * f
+            shared[first - low::f] = bytes([1]) * len(range(first, high + 1, f))
+        invalid = list(compress(range(low, high + 1), shared))
+        if len(invalid) >= food_count - 1:
+            return valid, invalid, widenings
+        high += below + above
+    raise ValueError(f"no {food_count - 1} numbers sharing a factor with φ = {phi} near it")
+
+def exponent_options(p, q, food_count, rng=random):
+    """Return (valid_e, invalid_numbers) for stage 2: EXPONENT_CHOICES exponents
+       coprime with φ (fewer if φ is tiny), and food_count - 1 distinct
+       distractors that are not, both sampled from exponent_pools."""
+    valid, invalid = exponent_pools(p, q, food_count)
+    valid_e = rng.sample(valid, EXPONENT_CHOICES) if len(valid) >= EXPONENT_CHOICES else valid[:]
+    return valid_e, rng.sample(invalid, food_count - 1)
+
+def exponent_counts(p, q, food_count):
+    """Sizes behind exponent_options for p and q: the pools, how many of each it
+       samples, and how often the invalid window was widened (at most
+       MAX_WINDOW_WIDENINGS, which bounds the work)."""
+    valid, invalid, widenings = _exponent_pools(p, q, food_count)
+    return {"valid": len(valid), "invalid": len(invalid),
+            "valid_sampled": min(EXPONENT_CHOICES, len(valid)), "invalid_sampled": food_count - 1,
+            "widenings": widenings}
+
+class KeyBundle:
+    """Everything a round needs before play starts: the stage 1 numbers, p, q,
+       n, φ(n), the stage 2 exponent choices, and d plus its CRT key
+       (p, q, dp, dq, qinv) for every valid e."""
+
+    def __init__(self, difficulty, numbers, primes, valid_e, invalid_numbers):
+        p, q = primes
+        self.seed = None   # Set by seeded_key_bundle, so replays can rebuild the bundle.
+        self.difficulty = difficulty
+        self.numbers = numbers
+        self.primes = primes
+        self.n = p * q
+        self.phi = (p - 1) * (q - 1)
+        self.valid_e = valid_e
+        self.invalid_numbers = invalid_numbers
+        self.d = dict(zip(valid_e, batch_mod_inverse(valid_e, self.phi)))
+        self.crt = {e: crt_params(p, q, d) for e, d in self.d.items()}
+
+def build_key_bundle(difficulty, rng=random):
+    numbers, primes = generate_numbers(difficulty, rng)
+    valid_e, invalid_numbers = exponent_options(primes[0], primes[1], food_count_for(difficulty), rng)
+    return KeyBundle(difficulty, numbers, primes, valid_e, invalid_numbers)
+
+def seeded_key_bundle(difficulty, seed):
+    """build_key_bundle from random.Random(seed); the same seed always gives the same bundle."""
+    bundle = build_key_bundle(difficulty, random.Random(seed))
+    bundle.seed = seed
+    return bundle
+
+# -------------------------------------------------------------------
+# Stage rules
+
+class StageState:
+    """Snake, food and direction for one stage. Subclasses supply the puzzle.
+
+    `result` stays None until the stage is cleared; it then holds what the
+    next stage needs (see each subclass).
+    """
+
+    number = 0
+
+    def __init__(self, snake, difficulty, rng=random):
+        self.snake = snake if isinstance(snake, Snake) else Snake(snake)
+        self.difficulty = difficulty
+        self.rng = rng
+        self.food_count = food_count_for(difficulty)
+        self.direction = None
+        self.free = FreeCells(self.snake)
+        self.food = {}              # cell index -> food value
+        self.food_positions = []    # Pixel positions and values of self.food, for drawing.
+        self.food_values = []
+        self.dirty_cells = set()    # Cells whose contents changed; cleared by the renderer.
+        self.result = None
+
+    def turn(self, direction):
+        """Apply one arrow key press; reversing onto the neck is ignored."""
+        if self.direction is None or direction != OPPOSITE[self.direction]:
+            self.direction = direction
+
+    def step(self):
+        """Advance the snake by one cell and return MOVED, ATE, CRASHED or CLEARED.
+           Returns None while the snake is still waiting for its first direction."""
+        if self.direction is None:
+            return None
+        snake = self.snake
+        index = CELL_STEPS[self.direction][snake.cells[0]]
+        # Check for collision with walls (playing area boundaries) or itself.
+        # The tail still counts: it only moves after the head has.
+        if index < 0 or snake.occupied[index]:
+            return CRASHED
+        snake.push_head(index)
+        self.dirty_cells.add(index)
+        if index in self.food:
+            self.eat(self.food.pop(index))
+            return CLEARED if self.result is not None else ATE
+        self.free.remove(index)
+        tail = snake.pop_tail()
+        self.free.add(tail)
+        self.dirty_cells.add(tail)
+        return MOVED
+
+    def place_food(self, values):
+        """Replace all food with `values`, each on its own free cell, so food never
+           lands on the snake or on other food."""
+        free = self.free
+        for index in self.food:
+            free.add(index)
+        self.dirty_cells.update(self.food)
+        self.food = {}
+        for value in values:
+            if not free:
+                break
+            self.food[free.pop_random(self.rng)] = value
+        self.dirty_cells.update(self.food)
+        self.food_positions = [cell_position(index) for index in self.food]
+        self.food_values = list(self.food.values())
+
+    def spawn_food(self):
+        raise NotImplementedError
+
+    def eat(self, value):
+        raise NotImplementedError
+
+    def is_correct(self, value):
+        """Whether eating `value` now makes progress (used by bots and hints)."""
+        raise NotImplementedError
+
+    def reset(self):
+        """Crash recovery, in place: recenter the snake (same length), stop it and
+           respawn the food. The stage's puzzle is kept; only progress made
+           within the stage is lost."""
+        self.snake.recenter()
+        self.direction = None
+        self.free = FreeCells(self.snake)
+        self.food = {}
+        self.dirty_cells.clear()
+        self.reset_progress()
+        self.spawn_food()
+
+    def reset_progress(self):
+        pass
+
+class Stage1(StageState):
+    """Stage 1: Eat two prime numbers (p and q). Result: (primes, snake).
+
+    `bundle` is a ready KeyBundle (e.g. from keypool) so expert keys can be
+    built off the game loop; without one the numbers are generated here.
+    """
+
+    number = 1
+
+    def __init__(self, snake, difficulty, rng=random, bundle=None):
+        super().__init__(snake, difficulty, rng)
+        if bundle is not None:
+            self.numbers, correct_primes = bundle.numbers, bundle.primes
+        else:
+            self.numbers, correct_primes = generate_numbers(difficulty, rng)
+        self.bundle = bundle
+        self.primes_required = correct_primes[:]
+        self.primes_collected = []
+        self.spawn_food()
+
+    def spawn_food(self):
+        self.place_food(self.rng.sample(self.numbers, self.food_count))
+
+    def eat(self, value):
+        if value in self.primes_required and value not in self.primes_collected:
+            self.primes_collected.append(value)
+        self.spawn_food()
+        if len(self.primes_collected) == 2:
+            self.result = (self.primes_required, self.snake)
+
+    def is_correct(self, value):
+        return value in self.primes_required and value not in self.primes_collected
+
+    def reset_progress(self):
+        self.primes_collected = []
+
+class Stage2(StageState):
+    """Stage 2: Select a valid key exponent e. Result: (e, d, snake).
+
+    A KeyBundle for the same p and q supplies the exponent choices and d;
+    without one, d for every choice is computed here in one batch.
+    `private_exponents` maps each valid e to its d.
+    """
+
+    number = 2
+
+    def __init__(self, snake, difficulty, p, q, rng=random, bundle=None):
+        super().__init__(snake, difficulty, rng)
+        self.p, self.q = p, q
+        self.n = p * q
+        self.phi = (p - 1) * (q - 1)
+        if bundle is not None and sorted(bundle.primes) == sorted((p, q)):
+            self.valid_e, self.invalid_numbers = bundle.valid_e, bundle.invalid_numbers
+            self.private_exponents = bundle.d
+        else:
+            bundle = None
+            self.valid_e, self.invalid_numbers = exponent_options(p, q, self.food_count, rng)
+            self.private_exponents = dict(zip(self.valid_e, batch_mod_inverse(self.valid_e, self.phi)))
+        self.bundle = bundle
+        self.spawn_food()
+
+    def spawn_food(self):
+        values = ([self.rng.choice(self.valid_e)] if self.valid_e else [])
+        values.extend(self.rng.sample(self.invalid_numbers, self.food_count - 1))
+        self.place_food(values)
+
+    def eat(self, value):
+        if value in self.valid_e:
+            self.result = (value, self.private_exponents[value], self.snake)
+        else:
+            self.spawn_food()
+
+    def is_correct(self, value):
+        return value in self.valid_e
+
+class Stage3(StageState):
+    """Stage 3: Collect letters to form a target word. Result: (plaintext, encrypted, snake)."""
+
+    number = 3
+
+    def __init__(self, snake, difficulty, n, e, rng=random):
+        super().__init__(snake, difficulty, rng)
+        self.n, self.e = n, e
+        # Choose a word with at least 5 letters.
+        self.target_word = rng.choice([w for w in VALID_WORDS if len(w) >= 5])
+        self.progress_index = 0
+        self.spawn_food()
+
+    def spawn_food(self):
+        correct_letter = self.target_word[self.progress_index]
+        letters = [correct_letter]
+        while len(letters) < self.food_count:
+            letter = self.rng.choice(ALPHABET)
+            if letter == correct_letter:
+                continue
+            letters.append(letter)
+        self.place_food(letters)
+
+    def eat(self, value):
+        if value == self.target_word[self.progress_index]:
+            self.progress_index += 1
+            if self.progress_index == len(self.target_word):
+                plaintext = self.target_word
+                encrypted = encrypt_message(plaintext, self.e, self.n, PACK_MESSAGES)
+                self.result = (plaintext, encrypted, self.snake)
+                return
+        self.spawn_food()
+
+    def is_correct(self, value):
+        return value == self.target_word[self.progress_index]
+
+    def reset_progress(self):
+        self.progress_index = 0
+
+class Stage4(StageState):
+    """Stage 4: Collect first n then d. Result: the decrypted message.
+
+    `crt` is the CRT key from crt_params; decryption falls back to pow(c, d, n)
+    without it.
+    """
+
+    number = 4
+
+    def __init__(self, snake, difficulty, n, d, plaintext, encrypted, rng=random, crt=None):
+        super().__init__(snake, difficulty, rng)
+        self.n, self.d = n, d
+        self.crt = crt
+        self.plaintext = plaintext
+        self.encrypted = encrypted
+        self.target_sequence = [n, d]
+        self.progress_index = 0
+        self.spawn_food()
+
+    def spawn_food(self):
+        correct_value = self.target_sequence[self.progress_index]
+        values = [correct_value]
+        while len(values) < self.food_count:
+            candidate = self.rng.randint(1, self.n + 10)
+            if candidate == correct_value:
+                continue
+            values.append(candidate)
+        self.place_food(values)
+
+    def eat(self, value):
+        if value == self.target_sequence[self.progress_index]:
+            self.progress_index += 1
+            if self.progress_index == len(self.target_sequence):
+                self.result = decrypt_message(self.encrypted, self.d, self.n, self.crt, PACK_MESSAGES)
+                return
+        self.spawn_food()
+
+    def is_correct(self, value):
+        return value == self.target_sequence[self.progress_index]
+
+    def reset_progress(self):
+        self.progress_index = 0
+
+# -------------------------------------------------------------------
+# Headless simulation
+
+class VirtualClock:
+    """Stand-in for pygame.time: time only moves when tick() is called."""
+
+    def __init__(self, tick_ms=TICK_MS):
+        self.tick_ms = tick_ms
+        self.ms = 0
+
+    def get_ticks(self):
+        return self.ms
+
+    def tick(self):
+        self.ms += self.tick_ms
+
+class FixedTimestep:
+    """Turns real frame times into whole logic ticks, so the snake moves one cell
+    per tick_ms however fast (or slowly) frames are drawn.
+
+    Leftover time carries over to the next frame. After a stall longer than
+    max_ticks ticks the backlog is dropped instead of replayed all at once.
+    """
+
+    def __init__(self, tick_ms=TICK_MS, max_ticks=MAX_CATCH_UP_TICKS):
+        self.tick_ms = tick_ms
+        self.max_ticks = max_ticks
+        self.last_ms = None
+        self.accumulated = 0
+
+    def reset(self, now_ms):
+        """Start counting from now_ms, e.g. after a menu or overlay."""
+        self.last_ms = now_ms
+        self.accumulated = 0
+
+    def advance(self, now_ms):
+        """Return how many logic ticks are due at now_ms."""
+        if self.last_ms is None:
+            self.reset(now_ms)
+            return 0
+        self.accumulated += now_ms - self.last_ms
+        self.last_ms = now_ms
+        ticks = int(self.accumulated // self.tick_ms)
+        if ticks > self.max_ticks:
+            self.accumulated = 0
+            return self.max_ticks
+        self.accumulated -= ticks * self.tick_ms
+        return ticks
+
+class Round:
+    """Stage state machine for one round.
+
+    Owns the current StageState and moves from stage 1 to stage 4 without
+    recursion: a crash resets the stage in place (keeping its puzzle), and a
+    cleared stage hands its result to the next one. After stage 4,
+    `completed` is set and `decrypted` holds the decrypted message.
+
+    With a seeded `rng` (and bundle) the round is reproducible; a `recorder`
+    (replay.ReplayRecorder) is told the direction used by every tick.
+    """
+
+    def __init__(self, difficulty, rng=random, bundle=None, snake=None, recorder=None):
+        self.difficulty = difficulty
+        self.rng = rng
+        self.bundle = bundle
+        self.recorder = recorder
+        self.direction = None       # Stage direction after the latest tick.
+        self.stage = Stage1(snake or initial_snake(), difficulty, rng, bundle)
+        self.last_cleared = None    # The StageState cleared by the latest step().
+        self.completed = False
+        self.ticks = 0
+        self.crashes = 0
+        self.elapsed_ms = 0
+        self.primes = None
+        self.n = None
+        self.e = None
+        self.d = None
+        self.crt = None
+        self.plaintext = None
+        self.encrypted = None
+        self.decrypted = None
+
+    def step(self):
+        """Advance the current stage by one tick and apply any transition.
+           Returns the stage's outcome (see StageState.step)."""
+        stage = self.stage
+        if self.recorder is not None:
+            self.recorder.tick(self.direction, stage.direction)
+        outcome = stage.step()
+        self.ticks += 1
+        if outcome == CRASHED:
+            self.crashes += 1
+            stage.reset()
+        elif outcome == CLEARED:
+            self.last_cleared = stage
+            self.advance(stage)
+        self.direction = self.stage.direction
+        return outcome
+
+    def advance(self, stage):
+        if stage.number == 1:
+            self.primes, snake = stage.result
+            self.n = self.primes[0] * self.primes[1]
+            self.stage = Stage2(snake, self.difficulty, self.primes[0], self.primes[1],
+                                self.rng, self.bundle)
+        elif stage.number == 2:
+            self.e, self.d, snake = stage.result
+            if stage.bundle is not None and self.e in stage.bundle.crt:
+                self.crt = stage.bundle.crt[self.e]
+            else:
+                self.crt = crt_params(self.primes[0], self.primes[1], self.d)
+            self.stage = Stage3(snake, self.difficulty, self.n, self.e, self.rng)
+        elif stage.number == 3:
+            self.plaintext, self.encrypted, snake = stage.result
+            self.stage = Stage4(snake, self.difficulty, self.n, self.d,
+                                self.plaintext, self.encrypted, self.rng, self.crt)
+        else:
+            self.decrypted = stage.result
+            self.completed = True
+
+    @property
+    def elapsed_seconds(self):
+        return self.elapsed_ms / 1000.0
+
+    @property
+    def verified(self):
+        """The round finished and decryption reproduced the plaintext."""
+        return self.completed and self.decrypted == self.plaintext
+
+def run_round(difficulty, input_source, clock=None, rng=random, max_ticks=20000, bundle=None,
+              recorder=None):
+    """Play stage1..stage4 once without a display and return the finished Round.
+
+    `input_source(state)` is called every tick with the current StageState and
+    returns the directions pressed during that tick (possibly empty), exactly
+    like the KEYDOWN events the pygame loop would have seen.
+    """
+    clock = clock or VirtualClock()
+    start_time = clock.get_ticks()
+    game_round = Round(difficulty, rng, bundle, recorder=recorder)
+    while not game_round.completed and game_round.ticks < max_ticks:
+        stage = game_round.stage
+        for direction in input_source(stage):
+            stage.turn(direction)
+        game_round.step()
+        clock.tick()
+    game_round.elapsed_ms = clock.get_ticks() - start_time
+    return game_round
+
+# -------------------------------------------------------------------
+# Input sources
+
+def autopilot(state):
+    """Greedy bot: head for the nearest correct food, else the nearest food."""
+    if not state.food:
+        return []
+    head = state.snake.cells[0]
+    head_x, head_y = CELL_COORDS[head]
+    is_correct = state.is_correct
+    target, target_distance = None, None
+    for index, value in state.food.items():
+        x, y = CELL_COORDS[index]
+        distance = abs(x - head_x) + abs(y - head_y)
+        if not is_correct(value):
+            distance += COLS + ROWS   # Only fall back to wrong food.
+        if target is None or distance < target_distance:
+            target, target_distance = index, distance
+    target_x, target_y = CELL_COORDS[target]
+
+    occupied = state.snake.occupied
+    backwards = OPPOSITE.get(state.direction)
+    best, best_distance = None, None
+    for direction in DIRECTIONS:
+        index = CELL_STEPS[direction][head]
+        if index < 0 or direction == backwards or occupied[index]:
+            continue
+        x, y = CELL_COORDS[index]
+        distance = abs(target_x - x) + abs(target_y - y)
+        if best is None or distance < best_distance:
+            best, best_distance = direction, distance
+    if best is None or best == state.direction:
+        return []
+    return [best]
+
+def random_input(rng=random, turn_chance=0.3):
+    """Build an input source that presses a random arrow key now and then."""
+    def source(state):
+        if state.direction is None or rng.random() < turn_chance:
+            return [rng.choice(DIRECTIONS)]
+        return []
+    return source
+
+# -------------------------------------------------------------------
+# Command line load test
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run RSA Snake rounds without a display.")
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--difficulty", choices=("easy", "medium", "hard", "expert"), default="easy")
+    parser.add_argument("--input", choices=("autopilot", "random"), default="autopilot")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--textbook", action="store_true",
+                        help="encrypt one character per block instead of packing blocks")
+    args = parser.parse_args(argv)
+
+    global PACK_MESSAGES
+    PACK_MESSAGES = not args.textbook
+    rng = random.Random(args.seed)
+    source = autopilot if args.input == "autopilot" else random_input(rng)
+
+    completed = failed = crashes = ticks = 0
+    began = time.perf_counter()
+    for _ in range(args.rounds):
+        result = run_round(args.difficulty, source, rng=rng)
+        completed += result.completed
+        failed += result.completed and not result.verified
+        crashes += result.crashes
+        ticks += result.ticks
+    wall = time.perf_counter() - began
+
+    print(f"{args.rounds} rounds ({args.difficulty}, {args.input}) in {wall:.2f}s: "
+          f"{args.rounds / wall:.0f} rounds/s, {ticks / wall:.0f} ticks/s")
+    print(f"completed: {completed}, decryption mismatches: {failed}, crashes: {crashes}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,17 @@
+import argparse
+import atexit
 import pygame
-import sys
 import random
-import math
+import sys
+from collections import OrderedDict
 
-pygame.init()
+import frameprof
+import replay
+import rsa_engine
+from rsa_engine import WIDTH, HEIGHT, GRID_SIZE, COLS, ROWS, UP, DOWN, LEFT, RIGHT, cell_position
+import rsa_math
 
-# Screen dimensions and grid settings
-WIDTH, HEIGHT = 600, 400
-GRID_SIZE = 20
+# Screen dimensions (playing area and grid size come from rsa_engine)
 INFO_HEIGHT = 130      # Height for instruction section (top)
 BUTTON_BAR_HEIGHT = 40 # Height for external button bar (bottom)
 
@@ -18,26 +22,114 @@ RED   = (255, 0, 0)
 BLACK = (0, 0, 0)
 BLUE  = (0, 0, 255)
 
-# Directions
-UP    = (0, -1)
-DOWN  = (0, 1)
-LEFT  = (-1, 0)
-RIGHT = (1, 0)
-
-# Initialize screen and font.
-# Total screen height = INFO_HEIGHT + HEIGHT (playing area) + BUTTON_BAR_HEIGHT.
-screen = pygame.display.set_mode((WIDTH, INFO_HEIGHT + HEIGHT + BUTTON_BAR_HEIGHT))
-pygame.display.set_caption("RSA Snake Game")
-font = pygame.font.Font(None, 28)
-clock = pygame.time.Clock()
+# Arrow keys to directions
+KEY_DIRECTIONS = {
+    pygame.K_UP: UP,
+    pygame.K_DOWN: DOWN,
+    pygame.K_LEFT: LEFT,
+    pygame.K_RIGHT: RIGHT,
+}
+
+# Window, fonts and clock; created by init_display(), so importing this module
+# (tools, benchmarks, key pool workers re-importing it under "spawn") does no
+# pygame setup. Total screen height = INFO_HEIGHT + HEIGHT + BUTTON_BAR_HEIGHT.
+screen = None
+font = None
+title_font = None     # Menu fonts are created once so the text cache can key on them.
+input_font = None
+menu_font = None
+overlay_font = None
+clock = None
 
 # Global game variables for buttons, pause, leaderboard, and difficulty.
 paused = False
 pause_start_time = 0
 game_command = None   # Used to signal a command from a button (restart, main, newplayer).
-leaderboard = {}      # Maps player_name to best (lowest) round time.
+leaderboard = None    # scoreboard.Scoreboard of best round times; created by main().
+player_name = None    # Registered player, highlighted on the leaderboard.
+score_client = None   # scoreserver.ScoreClient when --score-server is given.
+recorder = None       # replay.ReplayRecorder of the round in progress.
+key_pool = None       # keypool.KeyPool prefetching round key material; created by main().
 # 'difficulty' will be set when the game starts (via the welcome screen)
 
+# Frame pacing: the snake moves LOGIC_HZ cells per second whatever the frame rate;
+# frames are drawn at up to RENDER_FPS (0 = uncapped). Both can be set on the command line.
+LOGIC_HZ = 10
+RENDER_FPS = 60
+IDLE_REDRAW_MS = 250  # Progress screens redraw this often while waiting for events.
+
+# Dirty-rectangle rendering: stage frames repaint and push only what changed.
+DIRTY_RENDERING = True
+BOARD_RECT = pygame.Rect(0, INFO_HEIGHT, WIDTH, HEIGHT)
+full_redraw = True    # Next stage frame repaints the whole window.
+drawn_info = []       # Info panel lines currently on screen.
+drawn_labels = {}     # Food cell index -> screen rect of its label currently on screen.
+
+# Frame phase profiling (see frameprof); configured by main() from flags and environment.
+profiler = frameprof.Profiler()
+PROFILE_OVERLAY = False
+OVERLAY_REFRESH_MS = 500   # The overlay's numbers are re-rendered this often.
+overlay_surface = None
+overlay_rendered_at = None
+
+# Rendered text surfaces, keyed by (font, text, color), least recently used first.
+TIMER_LABEL = "Time Elapsed: "   # Starts the info panel line that changes every frame.
+TEXT_CACHE_SIZE = 512
+text_cache = OrderedDict()
+text_cache_hits = 0
+text_cache_misses = 0
+
+def init_display():
+    """Initialize pygame, open the window and create the fonts and clock. Only the
+       first call does anything; returns the screen surface."""
+    global screen, font, title_font, input_font, menu_font, overlay_font, clock, BUTTON_RECTS
+    if screen is None:
+        pygame.init()
+        screen = pygame.display.set_mode((WIDTH, INFO_HEIGHT + HEIGHT + BUTTON_BAR_HEIGHT))
+        pygame.display.set_caption("RSA Snake Game")
+        font = pygame.font.Font(None, 28)
+        title_font = pygame.font.Font(None, 48)
+        input_font = pygame.font.Font(None, 36)
+        menu_font = pygame.font.Font(None, 32)
+        overlay_font = pygame.font.Font(None, 18)
+        clock = pygame.time.Clock()
+        BUTTON_RECTS = get_button_rects()
+    return screen
+
+# -------------------------------------------------------------------
+# Text rendering
+
+def render_text(text, color=WHITE, text_font=None, cache=True):
+    """font.render(text, True, color) through a bounded LRU cache, so labels that
+       do not change between frames are rasterized only once. Text that is new
+       nearly every frame (the running timer) passes cache=False, so it neither
+       counts as a miss nor evicts the stable labels."""
+    global text_cache_hits, text_cache_misses
+    if not cache:
+        return (text_font or font).render(text, True, color)
+    key = (text_font or font, text, color)
+    surface = text_cache.get(key)
+    if surface is not None:
+        text_cache.move_to_end(key)
+        text_cache_hits += 1
+        return surface
+    text_cache_misses += 1
+    surface = key[0].render(text, True, color)
+    text_cache[key] = surface
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return surface
+
+def render_info_line(line):
+    """Info panel line; the timer line changes every frame and bypasses the cache."""
+    return render_text(line, cache=not line.startswith(TIMER_LABEL))
+
+def text_cache_report():
+    lookups = text_cache_hits + text_cache_misses
+    rate = 100.0 * text_cache_hits / lookups if lookups else 0.0
+    return (f"Text cache: {text_cache_hits} hits, {text_cache_misses} misses "
+            f"({rate:.0f}% hit rate), {len(text_cache)}/{TEXT_CACHE_SIZE} surfaces")
+
 # -------------------------------------------------------------------
 # Helper functions for buttons and pause functionality
 
@@ -52,689 +144,590 @@ def get_button_rects():
     buttons["leaderboard"] = pygame.Rect(460, INFO_HEIGHT + HEIGHT + 5, 130, 30)
     return buttons
 
+# Hit-test table for check_button_click, built once by init_display().
+BUTTON_RECTS = None
+WELCOME_BACK_RECT = pygame.Rect(10, 10, 80, 30)
+LEADERBOARD_ROW_HEIGHT = 30
+LEADERBOARD_ROWS = (INFO_HEIGHT + HEIGHT + BUTTON_BAR_HEIGHT - 70) // LEADERBOARD_ROW_HEIGHT
+LEADERBOARD_BACK_RECT = pygame.Rect(WIDTH // 2 - 50, INFO_HEIGHT + HEIGHT + BUTTON_BAR_HEIGHT - 35, 100, 30)
+
 def draw_button_bar():
     """Draw the external button bar at the bottom of the window."""
-    button_rects = get_button_rects()
-    # Draw background for the button bar.
-    pygame.draw.rect(screen, (50, 50, 50), (0, INFO_HEIGHT + HEIGHT, WIDTH, BUTTON_BAR_HEIGHT))
-    for key, rect in button_rects.items():
-        pygame.draw.rect(screen, BLUE, rect)
-        text_surface = font.render(key.capitalize(), True, WHITE)
-        text_x = rect.x + (rect.width - text_surface.get_width()) // 2
-        text_y = rect.y + (rect.height - text_surface.get_height()) // 2
-        screen.blit(text_surface, (text_x, text_y))
+    screen.blit(get_layer("button_bar"), (0, INFO_HEIGHT + HEIGHT))
 
 def check_button_click(pos):
     """Return the id (a string) of the button that was clicked, or None."""
-    button_rects = get_button_rects()
-    for key, rect in button_rects.items():
+    for key, rect in BUTTON_RECTS.items():
         if rect.collidepoint(pos):
+            record_command(key)
             return key
     return None
 
+def record_command(name):
+    """Add a button command to the current round's replay."""
+    if recorder is not None:
+        recorder.command(name)
+
+# -------------------------------------------------------------------
+# Static layers: surfaces that never change for a given window size and
+# theme are composed once and then only blitted.
+
+def build_button_bar():
+    bar = pygame.Surface((WIDTH, BUTTON_BAR_HEIGHT))
+    bar.fill((50, 50, 50))
+    for key, rect in BUTTON_RECTS.items():
+        rect = rect.move(0, -(INFO_HEIGHT + HEIGHT))
+        pygame.draw.rect(bar, BLUE, rect)
+        text_surface = render_text(key.capitalize())
+        text_x = rect.x + (rect.width - text_surface.get_width()) // 2
+        text_y = rect.y + (rect.height - text_surface.get_height()) // 2
+        bar.blit(text_surface, (text_x, text_y))
+    return bar
+
+def build_info_panel():
+    panel = pygame.Surface((WIDTH, INFO_HEIGHT))
+    panel.fill(BLUE)
+    return panel
+
+def build_pause_overlay():
+    pause_overlay = pygame.Surface((WIDTH, HEIGHT))
+    pause_overlay.set_alpha(128)
+    pause_overlay.fill(BLACK)
+    return pause_overlay
+
+def build_back_button():
+    button = pygame.Surface(LEADERBOARD_BACK_RECT.size)
+    button.fill(BLUE)
+    back_text = render_text("Back")
+    button.blit(back_text, ((LEADERBOARD_BACK_RECT.width - back_text.get_width()) // 2,
+                            (LEADERBOARD_BACK_RECT.height - back_text.get_height()) // 2))
+    return button
+
+LAYER_BUILDERS = {
+    "button_bar": build_button_bar,
+    "info_panel": build_info_panel,
+    "pause_overlay": build_pause_overlay,
+    "back_button": build_back_button,
+}
+layers = {}   # (layer name, window size) -> composed Surface
+
+def get_layer(name):
+    """Return a static layer, composing it the first time it is needed at this window size."""
+    key = (name, screen.get_size())
+    layer = layers.get(key)
+    if layer is None:
+        layer = layers[key] = LAYER_BUILDERS[name]()
+    return layer
+
+def clear_layers():
+    """Drop every composed layer, e.g. after changing the theme colors or fonts."""
+    layers.clear()
+
+# -------------------------------------------------------------------
+# Pause
+
 def handle_pause(start_time):
     """While the game is paused, display an overlay and wait for an arrow key to resume.
        When resuming, adjust start_time so that the timer is frozen during pause."""
-    global paused, pause_start_time, game_command
+    global paused, game_command
+    # Compose the paused frame once; it is only redrawn after the leaderboard covered it.
+    paused_frame = screen.copy()
+    paused_frame.blit(get_layer("pause_overlay"), (0, INFO_HEIGHT))
+    paused_text = render_text("Paused")
+    paused_frame.blit(paused_text, (WIDTH // 2 - paused_text.get_width() // 2,
+                                    INFO_HEIGHT + HEIGHT // 2 - paused_text.get_height() // 2))
+    needs_draw = True
     while paused:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-            # Allow button clicks even while paused.
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                command = check_button_click(event.pos)
-                if command is not None:
-                    if command == "leaderboard":
-                        show_leaderboard()
-                    elif command in ("restart", "main", "newplayer"):
-                        game_command = command
-                        paused = False
-                        return start_time
-            if event.type == pygame.KEYDOWN:
-                # Resume when any arrow key is pressed.
-                if event.key in (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT):
-                    resume_time = pygame.time.get_ticks()
-                    start_time += (resume_time - pause_start_time)
+        if needs_draw:
+            screen.blit(paused_frame, (0, 0))
+            draw_button_bar()
+            pygame.display.flip()
+            needs_draw = False
+        # Nothing moves while paused, so sleep until the next event.
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            pygame.quit(); sys.exit()
+        # Allow button clicks even while paused.
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            command = check_button_click(event.pos)
+            if command is not None:
+                if command == "leaderboard":
+                    show_leaderboard()
+                    needs_draw = True
+                elif command in ("restart", "main", "newplayer"):
+                    game_command = command
                     paused = False
-        # Draw pause overlay on the playing area.
-        pause_overlay = pygame.Surface((WIDTH, HEIGHT))
-        pause_overlay.set_alpha(128)
-        pause_overlay.fill(BLACK)
-        screen.blit(pause_overlay, (0, INFO_HEIGHT))
-        paused_text = font.render("Paused", True, WHITE)
-        screen.blit(paused_text, (WIDTH // 2 - paused_text.get_width() // 2,
-                                  INFO_HEIGHT + HEIGHT // 2 - paused_text.get_height() // 2))
-        draw_button_bar()
-        pygame.display.flip()
-        clock.tick(10)
+                    return start_time
+        if event.type == pygame.KEYDOWN:
+            # Resume when any arrow key is pressed.
+            if event.key in (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT):
+                record_command("resume")
+                resume_time = pygame.time.get_ticks()
+                start_time += (resume_time - pause_start_time)
+                paused = False
+    request_full_redraw()
     return start_time
 
 # -------------------------------------------------------------------
 # Game functions (stages)
-
-def is_prime(n):
-    if n < 2:
-        return False
-    for i in range(2, int(n ** 0.5) + 1):
-        if n % i == 0:
-            return False
-    return True
-
-def generate_numbers(difficulty):
-    """
-    For easy, generate 5 unique numbers.
-    For medium/hard, generate 8 unique numbers.
-    This ensures that when 7 food values are needed later,
-    there is a large enough pool to choose from.
-    """
-    if difficulty == "easy":
-        target_count = 5
-        low, high = 10, 50
-    elif difficulty == "medium":
-        target_count = 8
-        low, high = 50, 150
-    else:  # hard
-        target_count = 8
-        low, high = 150, 500
-
-    numbers = []
-    primes = []
-    while len(numbers) < target_count:
-        num = random.randint(low, high)
-        if num not in numbers:
-            numbers.append(num)
-            if is_prime(num):
-                primes.append(num)
-    # Ensure at least two primes.
-    if len(primes) < 2:
-        return generate_numbers(difficulty)
-    return (numbers, primes[:2])
-
-def wrap_position(pos):
-    x, y = pos
-    if x < 0:
-        x = WIDTH - GRID_SIZE
-    elif x >= WIDTH:
-        x = 0
-    if y < 0:
-        y = HEIGHT - GRID_SIZE
-    elif y >= HEIGHT:
-        y = 0
-    return (x, y)
+#
+# The rules themselves live in rsa_engine so they can also run headless;
+# the functions below add input, drawing and the pause / button handling.
 
 def draw_snake(snake):
-    for segment in snake:
+    for index in snake.cells:
+        row, col = divmod(index, COLS)
         # Draw snake with offset = INFO_HEIGHT.
-        pygame.draw.rect(screen, GREEN, (segment[0], segment[1] + INFO_HEIGHT, GRID_SIZE, GRID_SIZE))
+        pygame.draw.rect(screen, GREEN, (col * GRID_SIZE, row * GRID_SIZE + INFO_HEIGHT, GRID_SIZE, GRID_SIZE))
+
+def format_number(value, show_length=True):
+    """Shorten key-sized numbers to their first and last digits, e.g. 1234…5678 (617 digits)."""
+    text = str(value)
+    if len(text) <= 10:
+        return text
+    if show_length:
+        return f"{text[:4]}…{text[-4:]} ({len(text)} digits)"
+    return f"{text[:4]}…{text[-4:]}"
+
+def format_food(value):
+    """Food tiles and ciphertext lists only have room for the shortened digits."""
+    return format_number(value, show_length=False)
 
 def draw_food(food_positions, food_values):
     for i, pos in enumerate(food_positions):
         # Draw food with offset = INFO_HEIGHT.
         pygame.draw.rect(screen, RED, (pos[0], pos[1] + INFO_HEIGHT, GRID_SIZE, GRID_SIZE))
-        text = font.render(str(food_values[i]), True, WHITE)
+        text = render_text(format_food(food_values[i]))
         screen.blit(text, (pos[0] + 5, pos[1] + INFO_HEIGHT + 5))
 
 def draw_info_section(text_lines):
-    pygame.draw.rect(screen, BLUE, (0, 0, WIDTH, INFO_HEIGHT))
+    screen.blit(get_layer("info_panel"), (0, 0))
     for idx, line in enumerate(text_lines):
-        text_surface = font.render(line, True, WHITE)
+        text_surface = render_info_line(line)
         screen.blit(text_surface, (10, 5 + idx * 25))
 
-def reposition_snake(snake):
-    """Reposition the snake in the center, preserving its length."""
-    length = len(snake)
-    centered_snake = []
-    center_x = WIDTH // 2
-    center_y = HEIGHT // 2
-    for i in range(length):
-        centered_snake.append((center_x - i * GRID_SIZE, center_y))
-    return centered_snake
-
-def stage1(snake, difficulty, start_time):
-    """Stage 1: Eat two prime numbers (p and q) to be used later."""
-    numbers, correct_primes = generate_numbers(difficulty)
-    primes_required = correct_primes[:]
-    primes_collected = []
-    
-    # Determine food count: 7 for medium/hard, 4 for easy.
-    food_count = 7 if difficulty in ("medium", "hard") else 4
-
-    food_positions = [
-        (random.randint(0, (WIDTH // GRID_SIZE) - 1) * GRID_SIZE,
-         random.randint(0, (HEIGHT // GRID_SIZE) - 1) * GRID_SIZE)
-        for _ in range(food_count)
-    ]
-    food_values = random.sample(numbers, food_count)
-
-    direction = None
+def handle_stage_events(state):
+    """Process this frame's events for a running stage.
+       Arrow keys turn the snake; returns a button command to leave the stage, or None."""
     global paused, game_command, pause_start_time
-    while True:
-        if paused:
-            start_time = handle_pause(start_time)
-            if game_command is not None:
-                cmd = game_command
-                game_command = None
-                return ("command", cmd)
-        current_ticks = pygame.time.get_ticks()
-        elapsed_time = (current_ticks - start_time) / 1000.0
+    events = pygame.event.get()
+    profiler.mark("events")
+    for event in events:
+        if event.type == pygame.QUIT:
+            pygame.quit(); sys.exit()
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            command = check_button_click(event.pos)
+            if command is not None:
+                if command == "pause":
+                    if not paused:
+                        paused = True
+                        pause_start_time = pygame.time.get_ticks()
+                elif command in ("restart", "main", "newplayer"):
+                    game_command = command
+                    return command
+                elif command == "leaderboard":
+                    show_leaderboard()
+                    request_full_redraw()
+                    profiler.discard()
+        if event.type == pygame.KEYDOWN and event.key in KEY_DIRECTIONS:
+            state.turn(KEY_DIRECTIONS[event.key])
+    profiler.mark("input")
+    return None
 
+def check_pause(start_time):
+    """Run the pause overlay if needed. Returns (start_time, command or None)."""
+    global game_command
+    if paused:
+        start_time = handle_pause(start_time)
+        if game_command is not None:
+            cmd = game_command
+            game_command = None
+            return start_time, cmd
+    return start_time, None
+
+def request_full_redraw():
+    """Repaint the whole window on the next stage frame (stage change or after an overlay)."""
+    global full_redraw
+    full_redraw = True
+
+def food_label_rect(index, value):
+    """Screen rect of a food tile's label, which spills past the tile itself."""
+    x, y = cell_position(index)
+    label = render_text(format_food(value))
+    return pygame.Rect(x + 5, y + INFO_HEIGHT + 5, label.get_width(), label.get_height()).clip(BOARD_RECT)
+
+def repaint_board_region(rect, state):
+    """Redraw everything inside `rect` of the playing area: background, snake cells, then food."""
+    screen.set_clip(rect)
+    screen.fill(BLACK, rect)
+    occupied = state.snake.occupied
+    first_col, last_col = rect.left // GRID_SIZE, (rect.right - 1) // GRID_SIZE
+    first_row, last_row = (rect.top - INFO_HEIGHT) // GRID_SIZE, (rect.bottom - 1 - INFO_HEIGHT) // GRID_SIZE
+    for row in range(max(first_row, 0), min(last_row, ROWS - 1) + 1):
+        for col in range(max(first_col, 0), min(last_col, COLS - 1) + 1):
+            if occupied[row * COLS + col]:
+                pygame.draw.rect(screen, GREEN, (col * GRID_SIZE, row * GRID_SIZE + INFO_HEIGHT, GRID_SIZE, GRID_SIZE))
+    for index, value in state.food.items():
+        x, y = cell_position(index)
+        tile = pygame.Rect(x, y + INFO_HEIGHT, GRID_SIZE, GRID_SIZE)
+        if tile.colliderect(rect) or drawn_labels.get(index, tile).colliderect(rect):
+            pygame.draw.rect(screen, RED, tile)
+            screen.blit(render_text(format_food(value)), (x + 5, y + INFO_HEIGHT + 5))
+    screen.set_clip(None)
+
+def draw_profile_overlay():
+    """Blit the frame profile in the top-right corner of the info panel; returns its rect."""
+    global overlay_surface, overlay_rendered_at
+    now = pygame.time.get_ticks()
+    if overlay_surface is None or now - overlay_rendered_at >= OVERLAY_REFRESH_MS:
+        lines = profiler.overlay_lines()
+        line_height = overlay_font.get_linesize()
+        overlay_surface = pygame.Surface((240, min(INFO_HEIGHT, line_height * len(lines) + 4)))
+        overlay_surface.fill(BLACK)
+        for idx, line in enumerate(lines):
+            overlay_surface.blit(overlay_font.render(line, True, WHITE), (4, 2 + idx * line_height))
+        overlay_rendered_at = now
+    rect = overlay_surface.get_rect(topright=(WIDTH, 0))
+    screen.blit(overlay_surface, rect)
+    return rect
+
+def draw_stage(state, info):
+    """Draw one stage frame. Normally only the changed info lines and the cells in
+       state.dirty_cells (plus food labels) are repainted and pushed with
+       display.update(rects); a full frame is drawn after request_full_redraw()."""
+    global full_redraw, drawn_info, drawn_labels
+    if full_redraw or not DIRTY_RENDERING:
         screen.fill(BLACK)
-        info = [
-            "Stage 1: Eat two largest prime numbers (p and q).",
-            "These two numbers will be multiplied to form n.",
-            f"Hint: Required primes: {primes_required}" if difficulty != "hard" else " ",
-            f"Collected: {primes_collected}",
-            f"Time Elapsed: {elapsed_time:.2f} seconds"
-        ]
         draw_info_section(info)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                command = check_button_click(event.pos)
-                if command is not None:
-                    if command == "pause":
-                        if not paused:
-                            paused = True
-                            pause_start_time = pygame.time.get_ticks()
-                    elif command in ("restart", "main", "newplayer"):
-                        game_command = command
-                        return ("command", command)
-                    elif command == "leaderboard":
-                        show_leaderboard()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP and direction != DOWN:
-                    direction = UP
-                elif event.key == pygame.K_DOWN and direction != UP:
-                    direction = DOWN
-                elif event.key == pygame.K_LEFT and direction != RIGHT:
-                    direction = LEFT
-                elif event.key == pygame.K_RIGHT and direction != LEFT:
-                    direction = RIGHT
-
-        if direction:
-            head = snake[0]
-            new_head = (head[0] + direction[0] * GRID_SIZE,
-                        head[1] + direction[1] * GRID_SIZE)
-            # Check for collision with walls (playing area boundaries) or itself.
-            if (new_head[0] < 0 or new_head[0] >= WIDTH or 
-                new_head[1] < 0 or new_head[1] >= HEIGHT or 
-                new_head in snake):
-                return stage1(reposition_snake(snake), difficulty, start_time)
-            snake.insert(0, new_head)
-            if new_head in food_positions:
-                index = food_positions.index(new_head)
-                value_eaten = food_values[index]
-                if value_eaten in primes_required and value_eaten not in primes_collected:
-                    primes_collected.append(value_eaten)
-                # Respawn food.
-                food_positions = [
-                    (random.randint(0, (WIDTH // GRID_SIZE) - 1) * GRID_SIZE,
-                     random.randint(0, (HEIGHT // GRID_SIZE) - 1) * GRID_SIZE)
-                    for _ in range(food_count)
-                ]
-                food_values = random.sample(numbers, food_count)
-                if len(primes_collected) == 2:
-                    return primes_required, snake
-            else:
-                snake.pop()
-
-        draw_snake(snake)
-        draw_food(food_positions, food_values)
+        profiler.mark("info")
+        draw_snake(state.snake)
+        draw_food(state.food_positions, state.food_values)
         draw_button_bar()
+        profiler.mark("board")
+        if PROFILE_OVERLAY:
+            draw_profile_overlay()
+            profiler.mark("overlay")
         pygame.display.flip()
-        clock.tick(10)
+        profiler.mark("flip")
+        full_redraw = False
+        drawn_info = list(info)
+        drawn_labels = {index: food_label_rect(index, value) for index, value in state.food.items()}
+        state.dirty_cells.clear()
+        return
+
+    rects = []
+    if len(info) != len(drawn_info):
+        draw_info_section(info)
+        rects.append(pygame.Rect(0, 0, WIDTH, INFO_HEIGHT))
+    else:
+        for idx, line in enumerate(info):
+            if line != drawn_info[idx]:
+                strip = pygame.Rect(0, 5 + idx * 25, WIDTH, 25).clip(0, 0, WIDTH, INFO_HEIGHT)
+                screen.fill(BLUE, strip)
+                screen.blit(render_info_line(line), (10, 5 + idx * 25))
+                rects.append(strip)
+    drawn_info = list(info)
+    profiler.mark("info")
+
+    regions = []
+    for index in state.dirty_cells:
+        x, y = cell_position(index)
+        regions.append(pygame.Rect(x, y + INFO_HEIGHT, GRID_SIZE, GRID_SIZE))
+        old_label = drawn_labels.pop(index, None)
+        if old_label is not None:
+            regions.append(old_label)
+        if index in state.food:
+            drawn_labels[index] = food_label_rect(index, state.food[index])
+            regions.append(drawn_labels[index])
+    state.dirty_cells.clear()
+    for region in regions:
+        repaint_board_region(region, state)
+    rects.extend(regions)
+    profiler.mark("board")
+    if PROFILE_OVERLAY:
+        rects.append(draw_profile_overlay())
+        profiler.mark("overlay")
+
+    if rects:
+        pygame.display.update(rects)
+    profiler.mark("flip")
+
+def take_key_bundle(difficulty):
+    """Pop the next KeyBundle from the prefetch pool. If the pool ran empty, show a
+       progress screen (keeping the window responsive) until the workers finish one.
+       If the pool fails (a worker died, the executor broke), build a seeded bundle
+       here instead, so the round still starts and can still be replayed."""
+    try:
+        future = key_pool.take(difficulty)
+        while not future.done():
+            screen.fill(BLACK)
+            message = (f"Generating a {rsa_math.EXPERT_KEY_BITS}-bit RSA key" if difficulty == "expert"
+                       else "Preparing keys")
+            dots = pygame.time.get_ticks() // IDLE_REDRAW_MS % 4
+            text_surface = render_text(message + "." * dots)
+            screen.blit(text_surface, (10, HEIGHT // 2))
+            pygame.display.flip()
+            if pygame.event.wait(IDLE_REDRAW_MS).type == pygame.QUIT:
+                pygame.quit(); sys.exit()
+        return future.result()
+    except Exception as error:
+        print(f"Key pool failed ({error!r}); generating the key in-process.")
+        return rsa_engine.seeded_key_bundle(difficulty, random.getrandbits(64))
 
-def stage2(snake, p, q, start_time):
-    """Stage 2: Select a valid key exponent e (coprime with φ(n))."""
-    global difficulty, paused, game_command, pause_start_time
-    n = p * q
-    phi = (p - 1) * (q - 1)
-
-    upper_bound = phi if phi < 1000 else 1000
-    valid_options = [e for e in range(3, upper_bound) if math.gcd(e, phi) == 1]
-    if not valid_options:
-        valid_options = [e for e in range(3, phi) if math.gcd(e, phi) == 1]
-    valid_e = random.sample(valid_options, 3) if len(valid_options) >= 3 else valid_options[:]
-
-    # Determine food count.
-    food_count = 7 if difficulty in ("medium", "hard") else 4
-
-    invalid_numbers = []
-    low_bound = max(2, phi - 100)
-    high_bound = phi + 10
-    while len(invalid_numbers) < (food_count - 1):
-        num = random.randint(low_bound, high_bound)
-        if math.gcd(num, phi) != 1 and num not in valid_e:
-            invalid_numbers.append(num)
-
-    food_positions = [
-        (random.randint(0, (WIDTH // GRID_SIZE) - 1) * GRID_SIZE,
-         random.randint(0, (HEIGHT // GRID_SIZE) - 1) * GRID_SIZE)
-        for _ in range(food_count)
+def stage1_info(state, elapsed_time):
+    """Stage 1: Eat two prime numbers (p and q) to be used later."""
+    return [
+        "Stage 1: Eat two largest prime numbers (p and q).",
+        "These two numbers will be multiplied to form n.",
+        f"Hint: Required primes: {', '.join(map(format_food, state.primes_required))}"
+        if state.difficulty != "hard" else " ",
+        f"Collected: [{', '.join(map(format_food, state.primes_collected))}]",
+        f"{TIMER_LABEL}{elapsed_time:.2f} seconds"
     ]
-    current_food_values = ([random.choice(valid_e)] if valid_e else [])
-    current_food_values.extend(random.sample(invalid_numbers, food_count - 1))
-    random.shuffle(current_food_values)
 
-    direction = None
-    while True:
-        if paused:
-            start_time = handle_pause(start_time)
-            if game_command is not None:
-                cmd = game_command
-                game_command = None
-                return ("command", cmd)
-        current_ticks = pygame.time.get_ticks()
-        elapsed_time = (current_ticks - start_time) / 1000.0
-
-        screen.fill(BLACK)
-        info = [
-            "Stage 2: Select a valid key exponent e (coprime with φ(n)).",
-            f"n = {n}, φ(n) = {phi}",
-            f"Hint: Valid e options: {valid_e}",
-            f"Time Elapsed: {elapsed_time:.2f} seconds"
-        ]
-        draw_info_section(info)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                command = check_button_click(event.pos)
-                if command is not None:
-                    if command == "pause":
-                        if not paused:
-                            paused = True
-                            pause_start_time = pygame.time.get_ticks()
-                    elif command in ("restart", "main", "newplayer"):
-                        game_command = command
-                        return ("command", command)
-                    elif command == "leaderboard":
-                        show_leaderboard()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP and direction != DOWN:
-                    direction = UP
-                elif event.key == pygame.K_DOWN and direction != UP:
-                    direction = DOWN
-                elif event.key == pygame.K_LEFT and direction != RIGHT:
-                    direction = LEFT
-                elif event.key == pygame.K_RIGHT and direction != LEFT:
-                    direction = RIGHT
-
-        if direction:
-            head = snake[0]
-            new_head = (head[0] + direction[0] * GRID_SIZE,
-                        head[1] + direction[1] * GRID_SIZE)
-            if (new_head[0] < 0 or new_head[0] >= WIDTH or
-                new_head[1] < 0 or new_head[1] >= HEIGHT or
-                new_head in snake):
-                return stage2(reposition_snake(snake), p, q, start_time)
-            else:
-                snake.insert(0, new_head)
-                if new_head in food_positions:
-                    index = food_positions.index(new_head)
-                    selected_number = current_food_values[index]
-                    if selected_number in valid_e:
-                        e_selected = selected_number
-                        d = mod_inverse(e_selected, phi)
-                        return (e_selected, d, snake)
-                    else:
-                        food_positions = [
-                            (random.randint(0, (WIDTH // GRID_SIZE) - 1) * GRID_SIZE,
-                             random.randint(0, (HEIGHT // GRID_SIZE) - 1) * GRID_SIZE)
-                            for _ in range(food_count)
-                        ]
-                        current_food_values = ([random.choice(valid_e)] if valid_e else [])
-                        current_food_values.extend(random.sample(invalid_numbers, food_count - 1))
-                        random.shuffle(current_food_values)
-                else:
-                    snake.pop()
-
-        draw_snake(snake)
-        draw_food(food_positions, current_food_values)
-        draw_button_bar()
-        pygame.display.flip()
-        clock.tick(10)
+def stage2_info(state, elapsed_time):
+    """Stage 2: Select a valid key exponent e (coprime with φ(n))."""
+    return [
+        "Stage 2: Select a valid key exponent e (coprime with φ(n)).",
+        f"n = {format_number(state.n)}, φ(n) = {format_number(state.phi)}",
+        # Two lines: with the d values inline, the hint overran the window from medium up.
+        "Hint: Valid e options: " + ', '.join(map(str, state.private_exponents)),
+        "Their d, in order: " + ', '.join(map(format_food, state.private_exponents.values())),
+        f"{TIMER_LABEL}{elapsed_time:.2f} seconds"
+    ]
 
-def stage3(snake, n, e, start_time):
+def stage3_info(state, elapsed_time):
     """Stage 3: Collect letters to form a target word."""
-    global difficulty, paused, game_command, pause_start_time
-    valid_words = [
-        "HELLO", "WORLD", "APPLE", "BANANA", "ORANGE", "PEACH",
-        "MANGO", "CHERRY", "LEMON", "PYTHON", "COMPUTER", "KEYBOARD"
+    return [
+        f"Stage 3: Collect letters to form: {state.target_word}",
+        f"Next letter: {state.target_word[state.progress_index]}",
+        f"{TIMER_LABEL}{elapsed_time:.2f} seconds"
     ]
-    # Choose a word with at least 5 letters.
-    target_word = random.choice([w for w in valid_words if len(w) >= 5])
-    progress_index = 0
-
-    def generate_food():
-        global difficulty
-        food_count = 7 if difficulty in ("medium", "hard") else 4
-        food_positions = [
-            (random.randint(0, (WIDTH // GRID_SIZE) - 1) * GRID_SIZE,
-             random.randint(0, (HEIGHT // GRID_SIZE) - 1) * GRID_SIZE)
-            for _ in range(food_count)
-        ]
-        correct_letter = target_word[progress_index]
-        letters = [correct_letter]
-        while len(letters) < food_count:
-            letter = random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
-            if letter == correct_letter:
-                continue
-            letters.append(letter)
-        random.shuffle(letters)
-        return food_positions, letters
-
-    food_positions, food_letters = generate_food()
-    direction = None
-    while True:
-        if paused:
-            start_time = handle_pause(start_time)
-            if game_command is not None:
-                cmd = game_command
-                game_command = None
-                return ("command", cmd)
-        current_ticks = pygame.time.get_ticks()
-        elapsed_time = (current_ticks - start_time) / 1000.0
 
-        screen.fill(BLACK)
-        info = [
-            f"Stage 3: Collect letters to form: {target_word}",
-            f"Next letter: {target_word[progress_index]}",
-            f"Time Elapsed: {elapsed_time:.2f} seconds"
-        ]
-        draw_info_section(info)
+def stage4_info(state, elapsed_time):
+    """Stage 4: Decryption Challenge. Collect first n then d."""
+    return [
+        "Stage 4: Decryption Challenge",
+        "Encrypted: " + ' '.join(map(format_food, state.encrypted)),
+        "Collect in order: first n then d",
+        f"Hint: n = {format_number(state.n)}, d = {format_number(state.d)}",
+        f"{TIMER_LABEL}{elapsed_time:.2f} seconds"
+    ]
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                command = check_button_click(event.pos)
-                if command is not None:
-                    if command == "pause":
-                        if not paused:
-                            paused = True
-                            pause_start_time = pygame.time.get_ticks()
-                    elif command in ("restart", "main", "newplayer"):
-                        game_command = command
-                        return ("command", command)
-                    elif command == "leaderboard":
-                        show_leaderboard()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP and direction != DOWN:
-                    direction = UP
-                elif event.key == pygame.K_DOWN and direction != UP:
-                    direction = DOWN
-                elif event.key == pygame.K_LEFT and direction != RIGHT:
-                    direction = LEFT
-                elif event.key == pygame.K_RIGHT and direction != LEFT:
-                    direction = RIGHT
-
-        if direction:
-            head = snake[0]
-            new_head = (head[0] + direction[0] * GRID_SIZE,
-                        head[1] + direction[1] * GRID_SIZE)
-            if (new_head[0] < 0 or new_head[0] >= WIDTH or
-                new_head[1] < 0 or new_head[1] >= HEIGHT or
-                new_head in snake):
-                return stage3(reposition_snake(snake), n, e, start_time)
-            else:
-                snake.insert(0, new_head)
-                if new_head in food_positions:
-                    index = food_positions.index(new_head)
-                    letter_eaten = food_letters[index]
-                    if letter_eaten == target_word[progress_index]:
-                        progress_index += 1
-                        if progress_index == len(target_word):
-                            plaintext = target_word
-                            ascii_codes = [ord(c) for c in plaintext]
-                            encrypted = [pow(m, e, n) for m in ascii_codes]
-                            screen.fill(BLACK)
-                            disp_text = "Encrypted message: " + ' '.join(map(str, encrypted))
-                            text_surface = font.render(disp_text, True, WHITE)
-                            screen.blit(text_surface, (10, HEIGHT // 2))
-                            pygame.display.flip()
-                            waiting = True
-                            while waiting:
-                                for ev in pygame.event.get():
-                                    if ev.type == pygame.QUIT:
-                                        pygame.quit(); sys.exit()
-                                    if ev.type == pygame.KEYDOWN:
-                                        waiting = False
-                            return (plaintext, encrypted, snake)
-                        else:
-                            food_positions, food_letters = generate_food()
-                    else:
-                        food_positions, food_letters = generate_food()
-                else:
-                    snake.pop()
-
-        draw_snake(snake)
-        draw_food(food_positions, food_letters)
-        draw_button_bar()
-        pygame.display.flip()
-        clock.tick(10)
-
-def stage4(snake, n, d, plaintext, encrypted, start_time, player_name):
-    """Stage 4: Decryption Challenge. Collect first n then d.
-       Also updates the leaderboard with the round time."""
-    global difficulty, paused, game_command, pause_start_time, leaderboard
-    target_sequence = [n, d]
-    progress_index = 0
-
-    def generate_food():
-        global difficulty
-        food_count = 7 if difficulty in ("medium", "hard") else 4
-        food_positions = [
-            (random.randint(0, (WIDTH // GRID_SIZE) - 1) * GRID_SIZE,
-             random.randint(0, (HEIGHT // GRID_SIZE) - 1) * GRID_SIZE)
-            for _ in range(food_count)
-        ]
-        correct_value = target_sequence[progress_index]
-        food_values = [correct_value]
-        while len(food_values) < food_count:
-            candidate = random.randint(1, n + 10)
-            if candidate == correct_value:
-                continue
-            food_values.append(candidate)
-        random.shuffle(food_values)
-        return food_positions, food_values
+STAGE_INFO = {1: stage1_info, 2: stage2_info, 3: stage3_info, 4: stage4_info}
 
-    food_positions, food_values = generate_food()
-    direction = None
+def wait_for_key():
+    """Block (without polling) until any key is pressed."""
     while True:
-        if paused:
-            start_time = handle_pause(start_time)
-            if game_command is not None:
-                cmd = game_command
-                game_command = None
-                return ("command", cmd)
-        current_ticks = pygame.time.get_ticks()
-        elapsed_time = (current_ticks - start_time) / 1000.0
-
-        screen.fill(BLACK)
-        info = [
-            "Stage 4: Decryption Challenge",
-            "Encrypted: " + ' '.join(map(str, encrypted)),
-            "Collect in order: first n then d",
-            f"Hint: n = {n}, d = {d}",
-            f"Time Elapsed: {elapsed_time:.2f} seconds"
-        ]
-        draw_info_section(info)
+        ev = pygame.event.wait()
+        if ev.type == pygame.QUIT:
+            pygame.quit(); sys.exit()
+        if ev.type == pygame.KEYDOWN:
+            return
+
+def show_encrypted(encrypted):
+    """End of stage 3: show the ciphertext until a key is pressed."""
+    screen.fill(BLACK)
+    disp_text = "Encrypted message: " + ' '.join(map(format_food, encrypted))
+    text_surface = render_text(disp_text)
+    screen.blit(text_surface, (10, HEIGHT // 2))
+    pygame.display.flip()
+    wait_for_key()
+
+def finish_round(game_round, player_name, total_seconds):
+    """End of stage 4: update the leaderboard with the round time and show the result."""
+    # Queued for the writer thread; the store keeps each player's best (lowest) time.
+    leaderboard.record(player_name, difficulty, total_seconds)
+    replay_data = recorder.to_bytes(total_seconds * 1000, completed=True)
+    try:
+        replay.write(replay.replay_path(player_name), replay_data)
+    except OSError as error:
+        print(f"Could not save the replay: {error}")
+    if score_client is not None:
+        # A verifying server re-simulates the replay before it ranks the time.
+        score_client.submit(player_name, difficulty, total_seconds, replay_data)
+    plaintext = game_round.plaintext
+    decrypted_message = game_round.decrypted
+
+    result_msg = f"Decryption Success! Plaintext: {plaintext}" if decrypted_message == plaintext \
+                 else f"Decryption Failed! Expected: {plaintext}, got: {decrypted_message}"
+    timer_msg = f"Player {player_name} took {total_seconds:.2f} seconds"
 
+    screen.fill(BLACK)
+    text_surface = render_text(result_msg)
+    screen.blit(text_surface, (10, HEIGHT // 2 - 20))
+    text_timer = render_text(timer_msg, cache=False)
+    screen.blit(text_timer, (10, HEIGHT // 2 + 20))
+    pygame.display.flip()
+    wait_for_key()
+
+def new_round(difficulty):
+    """Take the round's key material (not timed), then start the stopwatch.
+       The round gets its own seeded RNG and a replay recorder.
+       Returns (round, start_time)."""
+    global recorder
+    bundle = take_key_bundle(difficulty)
+    round_seed = random.getrandbits(64)
+    recorder = replay.ReplayRecorder(difficulty, round_seed, bundle.seed, 1000.0 / LOGIC_HZ, player_name)
+    request_full_redraw()
+    game_round = rsa_engine.Round(difficulty, random.Random(round_seed), bundle, recorder=recorder)
+    return game_round, pygame.time.get_ticks()
+
+def start_round(difficulty):
+    """new_round() timed as a frame of its own: waiting for the key bundle and
+       building stage 1 are charged to the "transition" phase."""
+    profiler.begin_frame()
+    started = new_round(difficulty)
+    profiler.mark("transition")
+    profiler.end_frame()
+    return started
+
+def play_replay(path, speed=1.0):
+    """Play a saved replay in the window at `speed` times its recorded pace.
+       Esc stops; + and - change the speed."""
+    player = replay.ReplayPlayer(replay.Replay.load(path))
+    timestep = rsa_engine.FixedTimestep(tick_ms=player.replay.tick_ms / speed)
+    request_full_redraw()
+    while not player.finished:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit(); sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                command = check_button_click(event.pos)
-                if command is not None:
-                    if command == "pause":
-                        if not paused:
-                            paused = True
-                            pause_start_time = pygame.time.get_ticks()
-                    elif command in ("restart", "main", "newplayer"):
-                        game_command = command
-                        return ("command", command)
-                    elif command == "leaderboard":
-                        show_leaderboard()
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP and direction != DOWN:
-                    direction = UP
-                elif event.key == pygame.K_DOWN and direction != UP:
-                    direction = DOWN
-                elif event.key == pygame.K_LEFT and direction != RIGHT:
-                    direction = LEFT
-                elif event.key == pygame.K_RIGHT and direction != LEFT:
-                    direction = RIGHT
-
-        if direction:
-            head = snake[0]
-            new_head = (head[0] + direction[0] * GRID_SIZE, head[1] + direction[1] * GRID_SIZE)
-            if (new_head[0] < 0 or new_head[0] >= WIDTH or 
-                new_head[1] < 0 or new_head[1] >= HEIGHT or 
-                new_head in snake):
-                return stage4(reposition_snake(snake), n, d, plaintext, encrypted, start_time, player_name)
-            else:
-                snake.insert(0, new_head)
-                if new_head in food_positions:
-                    index = food_positions.index(new_head)
-                    value_eaten = food_values[index]
-                    if value_eaten == target_sequence[progress_index]:
-                        progress_index += 1
-                        if progress_index == len(target_sequence):
-                            total_ms = pygame.time.get_ticks() - start_time
-                            total_seconds = total_ms / 1000.0
-                            # Update leaderboard: record best (lowest) time for this player.
-                            if player_name not in leaderboard or total_seconds < leaderboard[player_name]:
-                                leaderboard[player_name] = total_seconds
-                            decrypted_chars = [chr(pow(c, d, n)) for c in encrypted]
-                            decrypted_message = ''.join(decrypted_chars)
-                            
-                            result_msg = f"Decryption Success! Plaintext: {plaintext}" if decrypted_message == plaintext \
-                                         else f"Decryption Failed! Expected: {plaintext}, got: {decrypted_message}"
-                            timer_msg = f"Player {player_name} took {total_seconds:.2f} seconds"
-                            
-                            screen.fill(BLACK)
-                            text_surface = font.render(result_msg, True, WHITE)
-                            screen.blit(text_surface, (10, HEIGHT // 2 - 20))
-                            text_timer = font.render(timer_msg, True, WHITE)
-                            screen.blit(text_timer, (10, HEIGHT // 2 + 20))
-                            pygame.display.flip()
-                            
-                            waiting = True
-                            while waiting:
-                                for ev in pygame.event.get():
-                                    if ev.type == pygame.QUIT:
-                                        pygame.quit(); sys.exit()
-                                    if ev.type == pygame.KEYDOWN:
-                                        waiting = False
-                            return snake
-                        else:
-                            food_positions, food_values = generate_food()
-                    else:
-                        food_positions, food_values = generate_food()
-                else:
-                    snake.pop()
-
-        draw_snake(snake)
-        draw_food(food_positions, food_values)
-        draw_button_bar()
-        pygame.display.flip()
-        clock.tick(10)
-
-# -------------------------------------------------------------------
-# Math helpers
-
-def extended_gcd(a, b):
-    if a == 0:
-        return (b, 0, 1)
-    else:
-        g, y, x = extended_gcd(b % a, a)
-        return (g, x - (b // a) * y, y)
-
-def mod_inverse(e, phi):
-    g, x, y = extended_gcd(e, phi)
-    if g != 1:
-        return None
-    else:
-        return x % phi
+                if event.key == pygame.K_ESCAPE:
+                    return
+                if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    speed *= 2
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    speed /= 2
+                timestep.tick_ms = player.replay.tick_ms / speed
+        now = pygame.time.get_ticks()
+        if full_redraw:
+            timestep.reset(now)
+        for _ in range(timestep.advance(now)):
+            if player.finished:
+                break
+            if player.step() in (rsa_engine.CRASHED, rsa_engine.CLEARED):
+                request_full_redraw()
+        state = player.round.stage
+        elapsed_time = player.round.ticks * player.replay.tick_ms / 1000.0
+        info = STAGE_INFO[state.number](state, elapsed_time)
+        info[-1] += f"  (replay of {player.replay.player}, x{speed:g})"
+        draw_stage(state, info)
+        clock.tick(RENDER_FPS)
+
+    game_round = player.round
+    verdict = "matches" if replay.matches(player.replay, game_round) else "does NOT match"
+    screen.fill(BLACK)
+    screen.blit(render_text(f"Replay ended after {game_round.ticks} ticks; it {verdict} the recording."),
+                (10, HEIGHT // 2))
+    pygame.display.flip()
+    wait_for_key()
 
 # -------------------------------------------------------------------
 # Menus
 
+def leaderboard_query(method, *args):
+    """Ask the shared score server if one is configured; fall back to the local
+       store while it cannot be reached (the client fails fast for a while after
+       a timeout, so an unreachable server stalls the screen at most once)."""
+    if score_client is not None:
+        try:
+            return getattr(score_client, method)(*args)
+        except OSError:
+            pass
+    return getattr(leaderboard, method)(*args)
+
 def show_leaderboard():
-    """Display the leaderboard page. Press the Back button to return."""
-    global leaderboard
-    running = True
-    while running:
-        screen.fill(BLACK)
-        title_text = font.render("Leaderboard", True, WHITE)
-        screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, 20))
-        sorted_leaderboard = sorted(leaderboard.items(), key=lambda x: x[1])
-        y_offset = 60
-        for i, (player, time_val) in enumerate(sorted_leaderboard):
-            entry_text = font.render(f"{i+1}. {player}: {time_val:.2f}s", True, WHITE)
-            screen.blit(entry_text, (50, y_offset))
-            y_offset += 30
-        # Draw Back button.
-        back_rect = pygame.Rect(WIDTH // 2 - 50, INFO_HEIGHT + HEIGHT + BUTTON_BAR_HEIGHT - 35, 100, 30)
-        pygame.draw.rect(screen, BLUE, back_rect)
-        back_text = font.render("Back", True, WHITE)
-        screen.blit(back_text, (back_rect.x + (back_rect.width - back_text.get_width()) // 2, 
-                                  back_rect.y + (back_rect.height - back_text.get_height()) // 2))
-        pygame.display.flip()
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                if back_rect.collidepoint(event.pos):
-                    running = False
-        clock.tick(10)
+    """Display the current difficulty's leaderboard as a scrollable list that only
+       renders the visible rows, opening at the player's own rank.
+       Up/Down, Page Up/Down, Home/End and the mouse wheel scroll; press the
+       Back button to return."""
+    rank, total = leaderboard_query("standing", difficulty, player_name)
+    last_top = max(0, total - LEADERBOARD_ROWS)
+    top = min(max(0, rank - LEADERBOARD_ROWS // 2), last_top) if rank else 0
+    needs_draw = True
+    while True:
+        if needs_draw:
+            screen.fill(BLACK)
+            title = f"Leaderboard ({difficulty})"
+            if rank:
+                title += f" - you are #{rank} of {total}"
+            title_text = render_text(title)
+            screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, 20))
+            y_offset = 60
+            for i, (player, time_val) in enumerate(leaderboard_query("top", difficulty, LEADERBOARD_ROWS, top), top + 1):
+                color = GREEN if player == player_name else WHITE
+                entry_text = render_text(f"{i}. {player}: {time_val:.2f}s", color)
+                screen.blit(entry_text, (50, y_offset))
+                y_offset += LEADERBOARD_ROW_HEIGHT
+            # Draw Back button.
+            screen.blit(get_layer("back_button"), LEADERBOARD_BACK_RECT)
+            pygame.display.flip()
+            needs_draw = False
+        event = pygame.event.wait()
+        scroll = 0
+        if event.type == pygame.QUIT:
+            pygame.quit(); sys.exit()
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if LEADERBOARD_BACK_RECT.collidepoint(event.pos):
+                return
+        elif event.type == pygame.MOUSEWHEEL:
+            scroll = -3 * event.y
+        elif event.type == pygame.KEYDOWN:
+            scroll = {pygame.K_UP: -1, pygame.K_DOWN: 1,
+                      pygame.K_PAGEUP: -LEADERBOARD_ROWS, pygame.K_PAGEDOWN: LEADERBOARD_ROWS,
+                      pygame.K_HOME: -total, pygame.K_END: total}.get(event.key, 0)
+        if scroll:
+            new_top = min(max(0, top + scroll), last_top)
+            needs_draw = new_top != top
+            top = new_top
 
 def show_welcome_screen():
-    screen.fill(BLACK)
-    font_large = pygame.font.Font(None, 48)
-    text_title = font_large.render("RSA Snake Game", True, WHITE)
-    screen.blit(text_title, (WIDTH // 2 - 100, HEIGHT // 2 - 100))
-
-    font_small = pygame.font.Font(None, 32)
-    text_easy = font_small.render("Press E for Easy", True, WHITE)
-    text_medium = font_small.render("Press M for Medium", True, WHITE)
-    text_hard = font_small.render("Press H for Hard", True, WHITE)
-    screen.blit(text_easy, (WIDTH // 2 - 90, HEIGHT // 2 - 40))
-    screen.blit(text_medium, (WIDTH // 2 - 90, HEIGHT // 2))
-    screen.blit(text_hard, (WIDTH // 2 - 90, HEIGHT // 2 + 40))
-
-    # Optional Back button.
-    back_rect = pygame.Rect(10, 10, 80, 30)
-    pygame.draw.rect(screen, BLUE, back_rect)
-    text_back = font_small.render("Back", True, WHITE)
-    screen.blit(text_back, (back_rect.x + 10, back_rect.y + 3))
-
-    pygame.display.flip()
-
+    """Let the player pick a difficulty. The Back button redraws the screen."""
     selected_difficulty = None
+    needs_draw = True
 
     while not selected_difficulty:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                if back_rect.collidepoint(event.pos):
-                    show_welcome_screen()
-                    return show_welcome_screen()
-
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_e:
-                    selected_difficulty = "easy"
-                elif event.key == pygame.K_m:
-                    selected_difficulty = "medium"
-                elif event.key == pygame.K_h:
-                    selected_difficulty = "hard"
-        clock.tick(10)
+        if needs_draw:
+            screen.fill(BLACK)
+            text_title = render_text("RSA Snake Game", text_font=title_font)
+            screen.blit(text_title, (WIDTH // 2 - 100, HEIGHT // 2 - 100))
+
+            text_easy = render_text("Press E for Easy", text_font=menu_font)
+            text_medium = render_text("Press M for Medium", text_font=menu_font)
+            text_hard = render_text("Press H for Hard", text_font=menu_font)
+            text_expert = render_text(f"Press X for Expert ({rsa_math.EXPERT_KEY_BITS}-bit keys)",
+                                      text_font=menu_font)
+            screen.blit(text_easy, (WIDTH // 2 - 90, HEIGHT // 2 - 40))
+            screen.blit(text_medium, (WIDTH // 2 - 90, HEIGHT // 2))
+            screen.blit(text_hard, (WIDTH // 2 - 90, HEIGHT // 2 + 40))
+            screen.blit(text_expert, (WIDTH // 2 - 90, HEIGHT // 2 + 80))
+
+            # Optional Back button.
+            pygame.draw.rect(screen, BLUE, WELCOME_BACK_RECT)
+            text_back = render_text("Back", text_font=menu_font)
+            screen.blit(text_back, (WELCOME_BACK_RECT.x + 10, WELCOME_BACK_RECT.y + 3))
+
+            pygame.display.flip()
+            needs_draw = False
+
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            pygame.quit(); sys.exit()
+
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if WELCOME_BACK_RECT.collidepoint(event.pos):
+                needs_draw = True
+
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_e:
+                selected_difficulty = "easy"
+            elif event.key == pygame.K_m:
+                selected_difficulty = "medium"
+            elif event.key == pygame.K_h:
+                selected_difficulty = "hard"
+            elif event.key == pygame.K_x:
+                selected_difficulty = "expert"
 
     return selected_difficulty
 
@@ -744,148 +737,136 @@ def register_player():
     while True:
         screen.fill(BLACK)
         prompt = "Enter your name: " + input_name
-        font_large = pygame.font.Font(None, 36)
-        input_text = font_large.render(prompt, True, WHITE)
+        input_text = render_text(prompt, text_font=input_font)
         screen.blit(input_text, (50, HEIGHT // 2))
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        # Redraw only after a key press; sleep until then.
+        event = pygame.event.wait()
+        while event.type != pygame.KEYDOWN:
             if event.type == pygame.QUIT:
                 pygame.quit(); sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN and input_name.strip() != "":
-                    return input_name.strip()
-                elif event.key == pygame.K_BACKSPACE:
-                    input_name = input_name[:-1]
-                else:
-                    input_name += event.unicode
-        clock.tick(30)
+            event = pygame.event.wait()
+        if event.key == pygame.K_RETURN and input_name.strip() != "":
+            return input_name.strip()
+        elif event.key == pygame.K_BACKSPACE:
+            input_name = input_name[:-1]
+        else:
+            input_name += event.unicode
 
 # -------------------------------------------------------------------
 # Main game loop
 
-def main():
-    global game_command, paused, difficulty
+def shutdown():
+    print(key_pool.report())
+    print(text_cache_report())
+    key_pool.close()
+    leaderboard.close()
+    if score_client is not None:
+        score_client.close()
+        print(score_client.report())
+    if profiler.enabled:
+        print(profiler.report())
+        if profiler.dump_path:
+            profiler.dump()
+
+def main(argv=None):
+    """Run the game: one iterative loop drives the current round's stage state
+       machine, so crashes and restarts never grow the call stack.
+
+       Each frame handles input, runs the logic ticks that are due (LOGIC_HZ per
+       second, fixed timestep) and draws once, capped at RENDER_FPS."""
+    global game_command, difficulty, player_name, score_client, LOGIC_HZ, RENDER_FPS
+    global profiler, PROFILE_OVERLAY, leaderboard, key_pool
+    parser = argparse.ArgumentParser(description="RSA Snake Game")
+    parser.add_argument("--logic-hz", type=float, default=LOGIC_HZ,
+                        help="snake moves per second (default %(default)s)")
+    parser.add_argument("--fps", type=int, default=RENDER_FPS,
+                        help="frame rate cap, 0 for uncapped (default %(default)s)")
+    parser.add_argument("--score-server", metavar="HOST[:PORT]", default=None,
+                        help="also submit times to (and show the leaderboard of) a shared score server")
+    parser.add_argument("--replay", metavar="FILE", default=None, help="watch a saved replay and exit")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
+    parser.add_argument("--profile", action="store_true",
+                        help=f"time each phase of every frame (or set {frameprof.ENV_ENABLE}=1)")
+    parser.add_argument("--profile-overlay", action="store_true", help="show the frame profile on screen")
+    parser.add_argument("--profile-dump", metavar="FILE", default=None,
+                        help="rewrite a JSON (or .prom Prometheus) profile snapshot every "
+                             f"{frameprof.DUMP_INTERVAL:g}s")
+    args = parser.parse_args(argv)
+    LOGIC_HZ, RENDER_FPS = args.logic_hz, args.fps
+    profiler = frameprof.Profiler.from_environment(args.profile or args.profile_overlay, args.profile_dump)
+    PROFILE_OVERLAY = args.profile_overlay
+    init_display()
+    if args.replay:
+        play_replay(args.replay, args.replay_speed)
+        return
+    if args.score_server:
+        host, _, port = args.score_server.partition(":")
+        import scoreserver   # Pulls in asyncio; only needed with a shared server.
+        score_client = scoreserver.ScoreClient(host, int(port or scoreserver.DEFAULT_PORT)).start()
+    timestep = rsa_engine.FixedTimestep(tick_ms=1000.0 / LOGIC_HZ)
+
+    import keypool      # Worker processes and SQLite are only needed to play,
+    import scoreboard   # not to import the module or watch a replay.
+    key_pool = keypool.KeyPool().start()
+    leaderboard = scoreboard.Scoreboard()
+    leaderboard.start()
+    atexit.register(shutdown)
     player_name = register_player()  # Register player's profile.
     difficulty = show_welcome_screen()
-    snake = [(WIDTH // 2, HEIGHT // 2)]
-    current_stage = 1
-    start_time = pygame.time.get_ticks()  # Start stopwatch before Stage 1.
+    game_round, start_time = start_round(difficulty)  # Start stopwatch before Stage 1.
 
     while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-
-        if current_stage == 1:
-            result = stage1(snake, difficulty, start_time)
-            if isinstance(result, tuple) and result[0] == "command":
-                cmd = result[1]
-                game_command = None
-                if cmd == "restart":
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "main":
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "newplayer":
-                    player_name = register_player()
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-            else:
-                primes, snake = result
-                current_stage = 2
-        elif current_stage == 2:
-            result = stage2(snake, primes[0], primes[1], start_time)
-            if isinstance(result, tuple) and result[0] == "command":
-                cmd = result[1]
-                game_command = None
-                if cmd == "restart":
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "main":
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "newplayer":
-                    player_name = register_player()
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-            else:
-                e, d, snake = result
-                n = primes[0] * primes[1]
-                current_stage = 3
-        elif current_stage == 3:
-            result = stage3(snake, n, e, start_time)
-            if isinstance(result, tuple) and result[0] == "command":
-                cmd = result[1]
-                game_command = None
-                if cmd == "restart":
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "main":
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "newplayer":
-                    player_name = register_player()
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-            else:
-                plaintext, encrypted, snake = result
-                current_stage = 4
-        elif current_stage == 4:
-            result = stage4(snake, n, d, plaintext, encrypted, start_time, player_name)
-            if isinstance(result, tuple) and result[0] == "command":
-                cmd = result[1]
-                game_command = None
-                if cmd == "restart":
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "main":
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-                elif cmd == "newplayer":
-                    player_name = register_player()
-                    difficulty = show_welcome_screen()
-                    snake = [(WIDTH // 2, HEIGHT // 2)]
-                    current_stage = 1
-                    start_time = pygame.time.get_ticks()
-                    continue
-            else:
-                snake = result
-                # Reset snake, stage, and restart timer for a new round.
-                snake = [(WIDTH // 2, HEIGHT // 2)]
-                current_stage = 1
-                start_time = pygame.time.get_ticks()
-        clock.tick(10)
+        start_time, command = check_pause(start_time)
+        profiler.begin_frame()
+        if command is None:
+            command = handle_stage_events(game_round.stage)
+        if command is not None:
+            game_command = None
+            profiler.end_frame()   # Before the menus, which wait for the player.
+            if command == "main":
+                difficulty = show_welcome_screen()
+            elif command == "newplayer":
+                player_name = register_player()
+                difficulty = show_welcome_screen()
+            game_round, start_time = start_round(difficulty)
+            continue
+
+        now = pygame.time.get_ticks()
+        if full_redraw:
+            # A new stage, or back from an overlay: time spent elsewhere is not owed as ticks.
+            timestep.reset(now)
+        outcome = None
+        for _ in range(timestep.advance(now)):
+            outcome = game_round.step()
+            if outcome in (rsa_engine.CRASHED, rsa_engine.CLEARED):
+                break
+        profiler.mark("logic")
+        if outcome == rsa_engine.CRASHED:
+            # The stage was reset in place; its puzzle is kept.
+            request_full_redraw()
+        elif outcome == rsa_engine.CLEARED:
+            # The logic phase above holds the stage change (and the encryption or
+            # decryption); close the frame before any screen that waits for a key.
+            profiler.end_frame()
+            if game_round.completed:
+                total_seconds = (pygame.time.get_ticks() - start_time) / 1000.0
+                finish_round(game_round, player_name, total_seconds)
+                # New snake, stage 1 and timer for a new round.
+                game_round, start_time = start_round(difficulty)
+                continue
+            if game_round.last_cleared.number == 3:
+                show_encrypted(game_round.encrypted)
+            request_full_redraw()
+            continue
+
+        state = game_round.stage
+        elapsed_time = (now - start_time) / 1000.0
+        draw_stage(state, STAGE_INFO[state.number](state, elapsed_time))
+        clock.tick(RENDER_FPS)
+        profiler.mark("sleep")
+        profiler.end_frame()
 
 if __name__ == "__main__":
     main()
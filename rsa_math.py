@@ -0,0 +1,325 @@
+import random
+from array import array
+from collections import OrderedDict
+from itertools import compress
+from math import gcd, isqrt, prod
+
+# -------------------------------------------------------------------
+# Difficulty ranges: difficulty -> (low, high, count).
+# `count` unique numbers are drawn per round (5 for easy, 8 for medium/hard,
+# so that 7 food values can be drawn later); two of them are primes.
+# Custom tiers can be added with set_difficulty_range(), which checks that
+# `count` is at least the number of food tiles the engine shows for that tier.
+
+DIFFICULTY_RANGES = {
+    "easy": (10, 50, 5),
+    "medium": (50, 150, 8),
+    "hard": (150, 500, 8),
+}
+
+# "expert" builds real RSA keys instead: p and q are EXPERT_KEY_BITS / 2 bits each.
+EXPERT_KEY_BITS = 2048
+EXPERT_KEY_BITS_RANGE = (512, 4096)
+EXPERT_NUMBER_COUNT = 8
+
+SEGMENT_SIZE = 1 << 16
+SMALL_PRIME_LIMIT = 1 << 16
+MILLER_RABIN_ROUNDS = 40
+# Miller-Rabin with these bases is exact below 3.3e24.
+DETERMINISTIC_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+DETERMINISTIC_LIMIT = 3317044064679887385961981
+
+_prime_tables = {}        # (low, high) -> array of the primes in [low, high]
+_small_sieve = None       # bytearray flags for 0..SMALL_PRIME_LIMIT
+_small_prime_list = None  # the primes in that sieve, for pre-filtering above it
+_small_primorial = None   # product of the primes below 2000, for one-gcd pre-filtering
+
+# Per-key memo tables for one-character-per-block messages.
+CIPHER_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+KEY_TABLE_CACHE_SIZE = 64
+_key_tables = OrderedDict()   # ("encrypt", e, n) / ("decrypt", d, n) -> dict, least recently used first
+
+# -------------------------------------------------------------------
+# Sieves
+
+def small_primes(limit):
+    """Return every prime <= limit (plain sieve of Eratosthenes)."""
+    if limit < 2:
+        return []
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for i in range(2, isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit + 1, i)))
+    return list(compress(range(limit + 1), sieve))
+
+def segmented_sieve(low, high, segment_size=SEGMENT_SIZE):
+    """Return the primes in [low, high] as an array, sieving one segment at a time
+       so memory stays bounded by segment_size for wide ranges."""
+    low = max(low, 2)
+    primes = array("Q")
+    if high < low:
+        return primes
+    base = small_primes(isqrt(high))
+    for start in range(low, high + 1, segment_size):
+        stop = min(start + segment_size, high + 1)
+        segment = bytearray([1]) * (stop - start)
+        for p in base:
+            if p * p >= stop:
+                break
+            first = max(p * p, -(-start // p) * p)
+            segment[first - start::p] = bytes(len(range(first, stop, p)))
+        primes.extend(compress(range(start, stop), segment))
+    return primes
+
+def prime_table(low, high):
+    """Return the (cached) primes in [low, high]; each range is sieved only once."""
+    key = (low, high)
+    table = _prime_tables.get(key)
+    if table is None:
+        table = _prime_tables[key] = segmented_sieve(low, high)
+    return table
+
+def set_difficulty_range(difficulty, low, high, count):
+    """Add or change a difficulty tier. The range is sieved right away so rounds
+       never pay for it, and must hold at least two primes and `count` numbers;
+       `count` must cover the food tiles stage 1 samples from those numbers."""
+    from rsa_engine import food_count_for   # rsa_engine imports this module.
+    if count < food_count_for(difficulty):
+        raise ValueError(f"{difficulty} shows {food_count_for(difficulty)} food tiles, "
+                         f"so it needs at least that many numbers, not {count}")
+    if high - low + 1 < count:
+        raise ValueError(f"range {low}..{high} cannot supply {count} unique numbers")
+    if len(prime_table(low, high)) < 2:
+        raise ValueError(f"range {low}..{high} holds fewer than two primes")
+    DIFFICULTY_RANGES[difficulty] = (low, high, count)
+
+# -------------------------------------------------------------------
+# Number helpers shared by the pygame front end and the headless engine.
+
+def _load_small_sieve():
+    global _small_sieve, _small_prime_list, _small_primorial
+    _small_prime_list = small_primes(SMALL_PRIME_LIMIT)
+    _small_sieve = bytearray(SMALL_PRIME_LIMIT + 1)
+    for p in _small_prime_list:
+        _small_sieve[p] = 1
+    _small_primorial = prod(p for p in _small_prime_list if p < 2000)
+
+def prime_factors(value, limit):
+    """Return the distinct primes <= limit (at most SMALL_PRIME_LIMIT) dividing value."""
+    if _small_sieve is None:
+        _load_small_sieve()
+    factors = []
+    for p in _small_prime_list:
+        if p > limit:
+            break
+        if value % p == 0:
+            factors.append(p)
+    return factors
+
+def miller_rabin(n, bases):
+    """Return False if any base proves n composite (n odd, > 3)."""
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def is_prime(n, rng=random):
+    """Table lookup below SMALL_PRIME_LIMIT. Above it, small-prime pre-filtering
+       and then Miller-Rabin: exact below DETERMINISTIC_LIMIT, probabilistic
+       (MILLER_RABIN_ROUNDS random bases) for key-sized numbers."""
+    if n < 2:
+        return False
+    if _small_sieve is None:
+        _load_small_sieve()
+    if n <= SMALL_PRIME_LIMIT:
+        return _small_sieve[n] == 1
+    if gcd(n, _small_primorial) != 1:
+        return False
+    if n < DETERMINISTIC_LIMIT:
+        return miller_rabin(n, DETERMINISTIC_BASES)
+    return miller_rabin(n, [rng.randrange(2, n - 1) for _ in range(MILLER_RABIN_ROUNDS)])
+
+def random_prime(bits, rng=random):
+    """Return a random prime with exactly `bits` bits and the top two bits set,
+       so the product of two of them has exactly 2 * bits bits."""
+    while True:
+        candidate = rng.getrandbits(bits) | (3 << (bits - 2)) | 1
+        if is_prime(candidate, rng):
+            return candidate
+
+def random_composite(bits, rng=random):
+    """Return a random odd composite the same size as random_prime(bits)."""
+    while True:
+        candidate = rng.getrandbits(bits) | (3 << (bits - 2)) | 1
+        if not is_prime(candidate, rng):
+            return candidate
+
+def generate_expert_numbers(key_bits=None, rng=random):
+    """Like generate_numbers, but p and q are real RSA primes for a key_bits modulus
+       and the distractors are composites of the same size."""
+    key_bits = key_bits or EXPERT_KEY_BITS
+    low, high = EXPERT_KEY_BITS_RANGE
+    if not low <= key_bits <= high:
+        raise ValueError(f"expert keys must be {low}-{high} bits, not {key_bits}")
+    bits = key_bits // 2
+    p = random_prime(bits, rng)
+    q = random_prime(bits, rng)
+    while q == p:
+        q = random_prime(bits, rng)
+    numbers = [p, q] + [random_composite(bits, rng) for _ in range(EXPERT_NUMBER_COUNT - 2)]
+    rng.shuffle(numbers)
+    return (numbers, [p, q])
+
+def generate_numbers(difficulty, rng=random):
+    """
+    Return (numbers, [p, q]) for a round.
+    `numbers` holds the tier's count of unique values from its range; p and q
+    are sampled straight from the range's prime table and the rest are
+    distractors drawn from the whole range, so there are no retries.
+    "expert" rounds use generate_expert_numbers instead.
+    """
+    if difficulty == "expert":
+        return generate_expert_numbers(rng=rng)
+    low, high, target_count = DIFFICULTY_RANGES.get(difficulty, DIFFICULTY_RANGES["hard"])
+    primes = rng.sample(prime_table(low, high), 2)
+    others = [num for num in rng.sample(range(low, high + 1), target_count)
+              if num not in primes]
+    numbers = primes + others[:target_count - 2]
+    rng.shuffle(numbers)
+    return (numbers, primes)
+
+def extended_gcd(a, b):
+    """Return (g, x, y) with a * x + b * y == g == gcd(a, b). Iterative, so
+       key-sized inputs do not hit the recursion limit."""
+    old_r, r = a, b
+    old_x, x = 1, 0
+    old_y, y = 0, 1
+    while r:
+        quotient = old_r // r
+        old_r, r = r, old_r - quotient * r
+        old_x, x = x, old_x - quotient * x
+        old_y, y = y, old_y - quotient * y
+    return (old_r, old_x, old_y)
+
+def mod_inverse(e, phi):
+    g, x, y = extended_gcd(e, phi)
+    if g != 1:
+        return None
+    else:
+        return x % phi
+
+def batch_mod_inverse(values, modulus):
+    """Return [mod_inverse(v, modulus) for v in values] with one extended GCD
+       (Montgomery's trick): invert the product of all values, then peel the
+       single inverses off using prefix products. If some value has no inverse
+       the product has none either, and each value is inverted on its own."""
+    prefix = []
+    product = 1
+    for value in values:
+        product = product * value % modulus
+        prefix.append(product)
+    inverse = mod_inverse(product, modulus)
+    if inverse is None:
+        return [mod_inverse(value, modulus) for value in values]
+    inverses = [None] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        inverses[i] = inverse * prefix[i - 1] % modulus
+        inverse = inverse * values[i] % modulus
+    if values:
+        inverses[0] = inverse
+    return inverses
+
+# -------------------------------------------------------------------
+# RSA messages
+
+def crt_params(p, q, d):
+    """Return the CRT private key (p, q, dp, dq, qinv) for decrypt_crt."""
+    return (p, q, d % (p - 1), d % (q - 1), mod_inverse(q, p))
+
+def decrypt_crt(c, key):
+    """pow(c, d, p * q) from two half-size exponentiations, recombined with Garner's formula."""
+    p, q, dp, dq, qinv = key
+    m1 = pow(c, dp, p)
+    m2 = pow(c, dq, q)
+    return m2 + (qinv * (m1 - m2) % p) * q
+
+def block_bytes(n):
+    """Plaintext bytes that fit in one block below n, after the 0x01 marker byte."""
+    return (n.bit_length() - 1) // 8 - 1
+
+def key_table(kind, exponent, n):
+    """Return the cached memo dict for one key, creating it (and evicting the least
+       recently used key's table) if needed."""
+    key = (kind, exponent, n)
+    table = _key_tables.get(key)
+    if table is None:
+        table = _key_tables[key] = {}
+        if len(_key_tables) > KEY_TABLE_CACHE_SIZE:
+            _key_tables.popitem(last=False)
+    else:
+        _key_tables.move_to_end(key)
+    return table
+
+def cipher_table(e, n):
+    """pow(ord(c), e, n) for every character c of CIPHER_ALPHABET, computed once per (e, n)."""
+    table = key_table("encrypt", e, n)
+    if not table:
+        table.update((c, pow(ord(c), e, n)) for c in CIPHER_ALPHABET)
+    return table
+
+def encode_message(text, n, packed=True):
+    """Turn text into integers below n. Packed, each block holds block_bytes(n)
+       UTF-8 bytes behind a 0x01 marker (so leading zero bytes survive); with
+       packed=False, or when n is too small for two bytes a block, each
+       character is its own block (textbook RSA)."""
+    size = block_bytes(n)
+    if not packed or size < 2:
+        return [ord(c) for c in text]
+    data = text.encode("utf-8")
+    return [int.from_bytes(b"\x01" + data[i:i + size], "big") for i in range(0, len(data), size)]
+
+def decode_message(blocks, n, packed=True):
+    """Inverse of encode_message."""
+    if not packed or block_bytes(n) < 2:
+        return ''.join(map(chr, blocks))
+    data = b"".join(m.to_bytes((m.bit_length() + 7) // 8, "big")[1:] for m in blocks)
+    return data.decode("utf-8", errors="replace")
+
+def is_packed(n, packed=True):
+    return packed and block_bytes(n) >= 2
+
+def encrypt_message(text, e, n, packed=True):
+    """Encrypt text; one-character blocks come from the key's cipher_table."""
+    if is_packed(n, packed):
+        return [pow(m, e, n) for m in encode_message(text, n)]
+    table = cipher_table(e, n)
+    return [table[c] if c in table else pow(ord(c), e, n) for c in text]
+
+def decrypt_blocks(blocks, d, n, crt=None):
+    """Raw pow(c, d, n) for every block, through the CRT key from crt_params when given."""
+    if crt is not None:
+        return [decrypt_crt(c, crt) for c in blocks]
+    return [pow(c, d, n) for c in blocks]
+
+def decrypt_message(blocks, d, n, crt=None, packed=True):
+    """Decrypt with the CRT key when given, else with pow(c, d, n). One-character
+       blocks are memoized per (d, n), since only the alphabet's ciphertexts recur."""
+    if is_packed(n, packed):
+        return decode_message(decrypt_blocks(blocks, d, n, crt), n)
+    table = key_table("decrypt", d, n)
+    for c in blocks:
+        if c not in table:
+            table[c] = decrypt_blocks([c], d, n, crt)[0]
+    return ''.join(chr(table[c]) for c in blocks)
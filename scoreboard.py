@@ -0,0 +1,269 @@
+"""
+Persistent leaderboard.
+
+Best round times per (difficulty, player) live in an SQLite database in WAL
+mode, indexed on (difficulty, seconds). Writes are queued and applied by a
+background thread, so the game loop never waits for the disk.
+
+Queries are answered from memory: each difficulty's times are loaded once
+into a RankedIndex (an indexable skip list), which keeps updates, a
+player's rank and any top-K / scroll window at O(log n).
+
+    python scoreboard.py --difficulty easy --page 1
+"""
+
+import argparse
+import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leaderboard.db")
+PAGE_SIZE = 15
+MAX_LEVEL = 32        # Skip list levels; enough for 4**32 entries.
+LEVEL_CHANCE = 0.25   # Chance that a node also appears one level up.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS best_times (
+    difficulty TEXT NOT NULL,
+    player     TEXT NOT NULL,
+    seconds    REAL NOT NULL,
+    PRIMARY KEY (difficulty, player)
+);
+CREATE INDEX IF NOT EXISTS best_times_by_time ON best_times (difficulty, seconds);
+"""
+
+# Keep a player's best (lowest) time only.
+UPSERT = """
+INSERT INTO best_times (difficulty, player, seconds) VALUES (?, ?, ?)
+ON CONFLICT (difficulty, player) DO UPDATE SET seconds = excluded.seconds
+WHERE excluded.seconds < best_times.seconds
+"""
+
+ALL = "SELECT difficulty, player, seconds FROM best_times ORDER BY difficulty, seconds"
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels   # Bottom-level steps to next[i]; the list end counts as one past the last node.
+
+class RankedIndex:
+    """Order-statistic skip list of (seconds, player), fastest first, plus each
+    player's best time. update(), rank() and finding the start of a top() /
+    scroll window all take O(log n) expected steps."""
+
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+        self.head = _Node(None, MAX_LEVEL)
+        self.levels = 1
+        self.best = {}     # player -> seconds
+
+    def __len__(self):
+        return len(self.best)
+
+    def _level(self):
+        level = 1
+        while level < MAX_LEVEL and self.rng.random() < LEVEL_CHANCE:
+            level += 1
+        return level
+
+    def _path(self, key):
+        """Last node before key on every level, and its position (head = 0)."""
+        update = [self.head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position = self.head, 0
+        for i in reversed(range(self.levels)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i] = node
+            positions[i] = position
+        return update, positions
+
+    def _insert(self, key):
+        update, positions = self._path(key)
+        position = positions[0] + 1
+        level = self._level()
+        if level > self.levels:
+            for i in range(self.levels, level):
+                self.head.width[i] = len(self.best) + 1
+            self.levels = level
+        node = _Node(key, level)
+        for i in range(level):
+            before = update[i]
+            node.next[i] = before.next[i]
+            node.width[i] = before.width[i] - (position - 1 - positions[i])
+            before.next[i] = node
+            before.width[i] = position - positions[i]
+        for i in range(level, self.levels):
+            update[i].width[i] += 1
+
+    def _remove(self, key):
+        update, _ = self._path(key)
+        node = update[0].next[0]
+        for i in range(self.levels):
+            if update[i].next[i] is node:
+                update[i].width[i] += node.width[i] - 1
+                update[i].next[i] = node.next[i]
+            else:
+                update[i].width[i] -= 1
+
+    def update(self, player, seconds):
+        """Record a round time; returns True if it is the player's new best."""
+        old = self.best.get(player)
+        if old is not None:
+            if seconds >= old:
+                return False
+            self._remove((old, player))
+        self._insert((seconds, player))
+        self.best[player] = seconds
+        return True
+
+    def rank(self, player):
+        """1-based rank of the player's best time, or None for unknown players."""
+        seconds = self.best.get(player)
+        if seconds is None:
+            return None
+        _, positions = self._path((seconds, player))
+        return positions[0] + 1
+
+    def top(self, limit=PAGE_SIZE, offset=0):
+        """[(player, seconds), ...] for ranks offset + 1 .. offset + limit."""
+        node, position = self.head, 0
+        for i in reversed(range(self.levels)):
+            while node.next[i] is not None and position + node.width[i] <= offset:
+                position += node.width[i]
+                node = node.next[i]
+        entries = []
+        node = node.next[0]
+        while node is not None and len(entries) < limit:
+            seconds, player = node.key
+            entries.append((player, seconds))
+            node = node.next[0]
+        return entries
+
+class Scoreboard:
+    """Best round times per difficulty: ranked in memory, written behind to
+    SQLite by a daemon thread. Use it from one (the game) thread."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._queue = queue.Queue()
+        self._writer = None
+        self.indexes = {}   # difficulty -> RankedIndex
+        self.written = 0
+
+    def start(self):
+        """Create the database if needed, load every difficulty's times into
+           memory and start the writer thread."""
+        if self._writer is None:
+            connection = connect(self.path)
+            try:
+                for difficulty, player, seconds in connection.execute(ALL):
+                    self.index(difficulty).update(player, seconds)
+            finally:
+                connection.close()
+            self._writer = threading.Thread(target=self._write_behind, name="scoreboard-writer",
+                                            daemon=True)
+            self._writer.start()
+        return self
+
+    def close(self):
+        """Apply the queued writes, then stop the writer."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def flush(self):
+        """Wait until every queued write is on disk."""
+        self._queue.join()
+
+    def index(self, difficulty):
+        index = self.indexes.get(difficulty)
+        if index is None:
+            index = self.indexes[difficulty] = RankedIndex()
+        return index
+
+    def _write_behind(self):
+        connection = connect(self.path)
+        try:
+            while True:
+                item = self._queue.get()
+                batch = [item]
+                # Coalesce whatever else is already queued into one transaction.
+                while item is not None and not self._queue.empty():
+                    item = self._queue.get()
+                    batch.append(item)
+                rows = [row for row in batch if row is not None]
+                if rows:
+                    with connection:
+                        connection.executemany(UPSERT, rows)
+                    self.written += len(rows)
+                for _ in batch:
+                    self._queue.task_done()
+                if item is None:
+                    return
+        finally:
+            connection.close()
+
+    def record(self, player, difficulty, seconds):
+        """Rank a finished round now and queue it for disk; returns at once.
+           Only a player's new best time is written."""
+        if self._writer is None:
+            self.start()
+        if self.index(difficulty).update(player, seconds):
+            self._queue.put((difficulty, player, seconds))
+
+    def top(self, difficulty, limit=PAGE_SIZE, offset=0):
+        """Return [(player, seconds), ...] for ranks offset + 1 .. offset + limit."""
+        if self._writer is None:
+            self.start()
+        return self.index(difficulty).top(limit, offset)
+
+    def rank(self, difficulty, player):
+        """1-based rank of the player's best time, or None."""
+        if self._writer is None:
+            self.start()
+        return self.index(difficulty).rank(player)
+
+    def count(self, difficulty):
+        if self._writer is None:
+            self.start()
+        return len(self.index(difficulty))
+
+    def standing(self, difficulty, player):
+        """(rank or None, number of ranked players), as one query."""
+        return self.rank(difficulty, player), self.count(difficulty)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a leaderboard page.")
+    parser.add_argument("--difficulty", choices=("easy", "medium", "hard", "expert"), default="easy")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    board = Scoreboard(args.db).start()
+    try:
+        offset = (args.page - 1) * PAGE_SIZE
+        for rank, (player, seconds) in enumerate(board.top(args.difficulty, offset=offset), offset + 1):
+            print(f"{rank}. {player}: {seconds:.2f}s")
+        print(f"{board.count(args.difficulty)} players on {args.difficulty}")
+    finally:
+        board.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,442 @@
+"""
+Shared score server for several game machines (optional).
+
+The server keeps one Scoreboard and speaks newline-delimited JSON over TCP,
+one reply per request, in order:
+
+    {"op": "submit", "scores": [[difficulty, player, seconds, replay?], ...]} -> {"accepted": n, "rejected": m}
+    {"op": "top", "difficulty": d, "limit": k, "offset": o}        -> {"entries": [[player, seconds], ...]}
+    {"op": "rank", "difficulty": d, "player": p}                     -> {"rank": r or null, "count": n}
+
+ScoreClient is the game's side: submit() returns at once, and a background
+thread sends the queued scores in batches (a player's times are coalesced to
+their best) and retries with exponential backoff while the server is away.
+
+With --verify the server only takes times that come with a replay (base64
+of the replay file) and that replay reproduces on its VerificationFarm.
+
+    python scoreserver.py serve --port 8765 --verify
+    python scoreserver.py loadtest --clients 2000 --requests 20
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import replay
+import scoreboard
+import verifier
+
+DEFAULT_PORT = 8765
+LISTEN_BACKLOG = 4096      # Pending connections the server accepts at once.
+BATCH_INTERVAL = 0.25      # Seconds the client waits for more scores before sending.
+RETRY_MIN, RETRY_MAX = 0.5, 30.0
+REQUEST_TIMEOUT = 2.0
+QUERY_BACKOFF = 30.0       # Seconds queries fail fast after the server could not be reached.
+MAX_TOP = 100              # Largest page a top request may ask for.
+DIFFICULTIES = ("easy", "medium", "hard", "expert")   # Each has a ranking; others are refused.
+MAX_REPLAY_BYTES = 16384   # Submitted replays above this size are refused unread.
+MAX_EXPERT_PENDING = 2     # Expert replays rebuild a 2048-bit key each; cap those in flight.
+
+# -------------------------------------------------------------------
+# Server
+
+def valid_score(score):
+    """[difficulty, player, seconds, ...] with a known difficulty, a text player
+       and a positive, finite time."""
+    if not isinstance(score, list) or len(score) < 3:
+        return False
+    difficulty, player, seconds = score[:3]
+    return (isinstance(difficulty, str) and difficulty in DIFFICULTIES and isinstance(player, str)
+            and isinstance(seconds, (int, float)) and not isinstance(seconds, bool)
+            and math.isfinite(seconds) and seconds > 0)
+
+class ScoreServer:
+    """Answers submit / top / rank requests from a Scoreboard. Everything runs on
+    the event loop's thread, which is the only one touching the board.
+
+    Given a VerificationFarm, submitted times are only recorded once their
+    replay reproduces them; the verdict's player, difficulty and time are used.
+    Oversized or overlong replays, and expert ones beyond MAX_EXPERT_PENDING
+    in flight, are refused before they reach the farm.
+    """
+
+    def __init__(self, board, farm=None):
+        self.board = board
+        self.farm = farm
+        self.connections = 0
+        self.requests = 0
+        self.expert_pending = 0
+
+    async def verify(self, data):
+        """The farm's Verdict for one replay, or None if it is refused unverified."""
+        if len(data) > MAX_REPLAY_BYTES:
+            return None
+        try:
+            header = replay.Replay(data)
+        except Exception:
+            return None
+        if header.ticks > verifier.MAX_TICKS:
+            return None
+        expert = header.difficulty == "expert"
+        if expert:
+            if self.expert_pending >= MAX_EXPERT_PENDING:
+                return None
+            self.expert_pending += 1
+        try:
+            return await asyncio.wrap_future(self.farm.submit(data))
+        finally:
+            if expert:
+                self.expert_pending -= 1
+
+    async def submit_verified(self, scores):
+        checks = []
+        for score in scores:
+            if not isinstance(score, list) or len(score) < 4 or not isinstance(score[3], str):
+                continue
+            if len(score[3]) > MAX_REPLAY_BYTES * 4 // 3 + 4:
+                continue
+            try:
+                data = base64.b64decode(score[3], validate=True)
+            except ValueError:
+                continue
+            checks.append(self.verify(data))
+        accepted = 0
+        for verdict in await asyncio.gather(*checks, return_exceptions=True):
+            # A worker failure (or a dead pool) counts as a rejection, not a lost batch.
+            if (isinstance(verdict, verifier.Verdict) and verdict.accepted
+                    and valid_score([verdict.difficulty, verdict.player, verdict.seconds])):
+                self.board.record(verdict.player, verdict.difficulty, verdict.seconds)
+                accepted += 1
+        return {"accepted": accepted, "rejected": len(scores) - accepted}
+
+    def dispatch(self, message):
+        op = message.get("op")
+        if op == "submit":
+            scores = message.get("scores", [])
+            if not isinstance(scores, list):
+                raise ValueError("scores must be a list")
+            if self.farm is not None:
+                return self.submit_verified(scores)
+            accepted = 0
+            for score in scores:
+                if valid_score(score):
+                    difficulty, player, seconds = score[:3]
+                    self.board.record(player, difficulty, float(seconds))
+                    accepted += 1
+            return {"accepted": accepted, "rejected": len(scores) - accepted}
+        if op in ("top", "rank") and message["difficulty"] not in DIFFICULTIES:
+            # Every difficulty asked about would otherwise get its own index.
+            raise ValueError(f"unknown difficulty {message['difficulty']!r}")
+        if op == "top":
+            limit = min(max(0, int(message.get("limit", scoreboard.PAGE_SIZE))), MAX_TOP)
+            offset = max(0, int(message.get("offset", 0)))
+            return {"entries": self.board.top(message["difficulty"], limit, offset)}
+        if op == "rank":
+            difficulty = message["difficulty"]
+            return {"rank": self.board.rank(difficulty, message["player"]),
+                    "count": self.board.count(difficulty)}
+        return {"error": f"unknown op {op!r}"}
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.requests += 1
+                try:
+                    reply = self.dispatch(json.loads(line))
+                    if asyncio.iscoroutine(reply):
+                        reply = await reply
+                except (ValueError, KeyError, TypeError, AttributeError, OverflowError) as error:
+                    reply = {"error": str(error)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Start listening; returns the asyncio Server (port 0 picks a free port)."""
+        return await asyncio.start_server(self.handle, host, port, backlog=LISTEN_BACKLOG,
+                                          limit=1 << 20)
+
+async def serve(host, port, db_path, verify_workers=None):
+    """Run the server; verify_workers (0 = one per core) turns on replay verification."""
+    board = scoreboard.Scoreboard(db_path).start()
+    farm = verifier.VerificationFarm(verify_workers).start() if verify_workers is not None else None
+    try:
+        server = await ScoreServer(board, farm).start(host, port)
+        print(f"Score server listening on {host}:{server.sockets[0].getsockname()[1]}"
+              + (f", verifying replays on {farm.workers} workers" if farm else ""))
+        async with server:
+            await server.serve_forever()
+    finally:
+        if farm is not None:
+            farm.close()
+            print(farm.report())
+        board.close()
+
+# -------------------------------------------------------------------
+# Client
+
+class ScoreClient:
+    """Non-blocking score submission plus blocking top / rank queries.
+
+    Queries share the client's connection and raise OSError when the server
+    cannot be reached, so callers can fall back to their local Scoreboard.
+    After a failure they raise at once for QUERY_BACKOFF seconds rather than
+    each waiting out the timeout again.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, batch_interval=BATCH_INTERVAL,
+                 timeout=REQUEST_TIMEOUT):
+        self.address = (host, port)
+        self.batch_interval = batch_interval
+        self.timeout = timeout
+        self._pending = {}   # (difficulty, player) -> (best seconds, its replay bytes) not yet sent
+        self._condition = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._socket = None
+        self._file = None
+        self._thread = None
+        self._closing = False
+        self._down_until = 0.0   # time.monotonic() before which queries fail fast
+        self.sent = 0
+        self.rejected = 0
+        self.batches = 0
+        self.retries = 0
+
+    def start(self):
+        if self._thread is None:
+            self._closing = False
+            self._thread = threading.Thread(target=self._send_loop, name="score-client", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=REQUEST_TIMEOUT):
+        """Try to send what is still queued, then stop."""
+        if self._thread is not None:
+            with self._condition:
+                self._closing = True
+                self._condition.notify()
+            self._thread.join(timeout)
+            self._thread = None
+        self._disconnect()
+
+    def submit(self, player, difficulty, seconds, replay=None):
+        """Queue a finished round (with its replay file's bytes for verifying
+           servers); returns at once."""
+        if self._thread is None:
+            self.start()
+        with self._condition:
+            key = (difficulty, player)
+            if key not in self._pending or seconds < self._pending[key][0]:
+                self._pending[key] = (seconds, replay)
+            self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    def _take_batch(self):
+        with self._condition:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _requeue(self, batch):
+        with self._condition:
+            for key, entry in batch.items():
+                if key not in self._pending or entry[0] < self._pending[key][0]:
+                    self._pending[key] = entry
+
+    def _send_loop(self):
+        delay = RETRY_MIN
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closing)
+                # Let a burst of rounds coalesce into one request.
+                self._condition.wait_for(lambda: self._closing, self.batch_interval)
+                closing = self._closing
+            batch = self._take_batch()
+            if batch:
+                scores = [[difficulty, player, seconds, base64.b64encode(replay).decode() if replay else None]
+                          for (difficulty, player), (seconds, replay) in batch.items()]
+                try:
+                    reply = self.request({"op": "submit", "scores": scores})
+                except OSError:
+                    self._requeue(batch)
+                    self.retries += 1
+                    if closing:
+                        return
+                    with self._condition:
+                        self._condition.wait_for(lambda: self._closing, delay * random.uniform(0.5, 1.0))
+                    delay = min(delay * 2, RETRY_MAX)
+                    continue
+                self.sent += len(scores)
+                self.rejected += reply.get("rejected", 0)
+                self.batches += 1
+                delay = RETRY_MIN
+            if closing and not self.pending():
+                return
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def request(self, message):
+        """Send one request and return its reply; raises OSError on failure."""
+        with self._io_lock:
+            try:
+                if self._socket is None:
+                    self._socket = socket.create_connection(self.address, self.timeout)
+                    self._file = self._socket.makefile("rb")
+                self._socket.sendall(json.dumps(message).encode() + b"\n")
+                line = self._file.readline()
+                if not line:
+                    raise ConnectionError("score server closed the connection")
+                reply = json.loads(line)
+            except ValueError as error:
+                self._disconnect()
+                self._down_until = time.monotonic() + QUERY_BACKOFF
+                raise ConnectionError(f"bad reply from score server: {error}") from error
+            except OSError:
+                self._disconnect()
+                self._down_until = time.monotonic() + QUERY_BACKOFF
+                raise
+            self._down_until = 0.0
+        if "error" in reply:
+            raise ConnectionError(reply["error"])
+        return reply
+
+    def query(self, message):
+        """request() for the blocking queries: raises at once while the server
+           recently failed, so the caller falls back without stalling."""
+        if time.monotonic() < self._down_until:
+            raise ConnectionError("score server recently unreachable")
+        return self.request(message)
+
+    # Same query interface as scoreboard.Scoreboard.
+
+    def top(self, difficulty, limit=scoreboard.PAGE_SIZE, offset=0):
+        reply = self.query({"op": "top", "difficulty": difficulty, "limit": limit, "offset": offset})
+        return [tuple(entry) for entry in reply["entries"]]
+
+    def rank(self, difficulty, player):
+        return self.standing(difficulty, player)[0]
+
+    def count(self, difficulty):
+        return self.standing(difficulty, "")[1]
+
+    def standing(self, difficulty, player):
+        """(rank or None, number of ranked players) in one round trip."""
+        reply = self.query({"op": "rank", "difficulty": difficulty, "player": player})
+        return reply["rank"], reply["count"]
+
+    def report(self):
+        return (f"Score server: sent {self.sent} scores in {self.batches} batches "
+                f"({self.rejected} rejected), "
+                f"{self.retries} retries, {self.pending()} pending")
+
+# -------------------------------------------------------------------
+# Load test
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def load_client(host, port, client_id, requests, latencies, rng):
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    player = f"load{client_id}"
+    try:
+        for _ in range(requests):
+            difficulty = rng.choice(("easy", "medium", "hard"))
+            roll = rng.random()
+            if roll < 0.6:
+                op, message = "submit", {"op": "submit", "scores": [[difficulty, player, rng.uniform(5, 120)]]}
+            elif roll < 0.8:
+                op, message = "top", {"op": "top", "difficulty": difficulty,
+                                      "limit": scoreboard.PAGE_SIZE, "offset": rng.randrange(1000)}
+            else:
+                op, message = "rank", {"op": "rank", "difficulty": difficulty, "player": player}
+            began = time.perf_counter()
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+            await reader.readline()
+            latencies[op].append(time.perf_counter() - began)
+    finally:
+        writer.close()
+
+async def load_test(args):
+    server = board = None
+    host, port = args.host, args.port
+    if host is None:
+        # No server given: start one in this process on a free port and a scratch database.
+        db_path = os.path.join(tempfile.mkdtemp(), "loadtest.db")
+        board = scoreboard.Scoreboard(db_path).start()
+        server = await ScoreServer(board).start("127.0.0.1", 0)
+        host, port = "127.0.0.1", server.sockets[0].getsockname()[1]
+
+    rng = random.Random(args.seed)
+    latencies = {"submit": [], "top": [], "rank": []}
+    began = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, i, args.requests, latencies, random.Random(rng.random()))
+                           for i in range(args.clients)))
+    wall = time.perf_counter() - began
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+        board.close()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{args.clients} clients x {args.requests} requests: {total} requests in {wall:.2f}s "
+          f"({total / wall:.0f} req/s)")
+    for op, values in latencies.items():
+        values.sort()
+        print(f"  {op:6} n={len(values):6}  p50 {percentile(values, 0.50) * 1000:7.2f} ms  "
+              f"p99 {percentile(values, 0.99) * 1000:7.2f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RSA Snake score server.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the score server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--db", default=scoreboard.DB_PATH)
+    serve_parser.add_argument("--verify", type=int, nargs="?", const=0, default=None, metavar="WORKERS",
+                              help="only accept times whose replay reproduces (default: one worker per core)")
+    load_parser = commands.add_parser("loadtest", help="measure request latency under many connections")
+    load_parser.add_argument("--host", default=None, help="server to test (default: start one in-process)")
+    load_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    load_parser.add_argument("--clients", type=int, default=1000)
+    load_parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    load_parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.db, args.verify))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(load_test(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
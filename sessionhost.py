@@ -0,0 +1,519 @@
+"""
+Multi-session game host.
+
+One asyncio process runs many independent rounds at once. Every connection
+is a Session with its own Round (snake, puzzle), timer and pause state; the
+host steps all running sessions together LOGIC_HZ times per second and sends
+each client its state after every tick. Clients are thin: they send arrow
+keys and commands and draw what they receive; `play` is such a client, drawing
+with the game's own functions, and the benchmark's bots are another.
+
+Newline-delimited JSON over TCP, like the score server:
+
+    client -> host   {"op": "hello", "player": p, "difficulty": d, "hints": b?}
+                     {"op": "turn", "direction": "up" | "down" | "left" | "right"}
+                     {"op": "pause"} / {"op": "resume"} / {"op": "restart"}
+                     {"op": "difficulty", "difficulty": d}
+    spectator        {"op": "watch", "player": p} -> {"op": "watching"}, then statestream frames
+    host -> client   {"op": "state", "tick": t, "elapsed": ms, "stage": s, "paused": b,
+                      "snake": [cell, ...], "food": [[cell, label], ...] (when changed),
+                      "info": [line, ...] (when changed),
+                      "goal": [cell, ...] (with "food", if hello asked for hints)}
+                     {"op": "finished", "seconds": s, "verified": b, "rank": r}
+
+"rank" is only sent for rounds that went onto the leaderboard: verified ones,
+on a host ticking at the default LOGIC_HZ. A host started with another
+--logic-hz moves every snake faster or slower, so its times are not
+comparable with the board's and nothing is recorded.
+
+Cells are indices into the COLS x ROWS board, head first; "goal" lists the
+food cells whose value makes progress. Spectators get
+the compact binary stream of statestream.py (length-prefixed frames) instead
+of JSON states.
+
+    python sessionhost.py serve --port 8766
+    python sessionhost.py play --player alice --difficulty medium
+    python sessionhost.py bench --sessions 100 200 400
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import frameprof
+import keypool
+import rsa_engine
+import rsa_game
+import scoreboard
+import statestream
+from rsa_engine import COLS, ROWS, UP, DOWN, LEFT, RIGHT, OPPOSITE
+
+DEFAULT_PORT = 8766
+LOGIC_HZ = 10
+MAX_WRITE_BUFFER = 64 * 1024   # A client this far behind skips states until it catches up.
+DIRECTION_NAMES = {"up": UP, "down": DOWN, "left": LEFT, "right": RIGHT}
+NAMES_OF_DIRECTIONS = {direction: name for name, direction in DIRECTION_NAMES.items()}
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+
+# -------------------------------------------------------------------
+# Sessions
+
+class Session:
+    """One player's game: the round in progress, its timer and pause state.
+       Owned by the host's event loop thread."""
+
+    def __init__(self, host, writer, player, difficulty, hints=False):
+        self.host = host
+        self.writer = writer
+        self.player = player
+        self.difficulty = difficulty
+        self.hints = hints          # Send the cells of the correct food with the food.
+        self.round = None           # None while the round's key bundle is being prepared.
+        self.start_ms = 0
+        self.paused = False
+        self.pause_start_ms = 0
+        self.food_changed = True
+        self.info_changed = True
+        self.skipped = 0            # States not sent because the client fell behind.
+        self.watchers = []          # Spectators' StreamWriters.
+        self.encoder = None         # statestream.StateEncoder, once someone watches.
+        self._starting = None
+
+    def new_round(self):
+        """Ask the key pool for a bundle; the round starts when it arrives."""
+        self.round = None
+        if self._starting is not None:
+            self._starting.cancel()
+        self._starting = asyncio.ensure_future(self._start_round(self.difficulty))
+
+    async def _start_round(self, difficulty):
+        bundle = await asyncio.wrap_future(self.host.key_pool.take(difficulty))
+        seed = random.getrandbits(64)
+        self.round = rsa_engine.Round(difficulty, random.Random(seed), bundle)
+        self.start_ms = self.host.now_ms()
+        self.paused = False
+        self.food_changed = self.info_changed = True
+        self._starting = None
+
+    def elapsed_ms(self, now_ms):
+        return (self.pause_start_ms if self.paused else now_ms) - self.start_ms
+
+    def handle(self, message):
+        op = message.get("op")
+        if op == "turn":
+            if self.round is not None and not self.paused:
+                self.round.stage.turn(DIRECTION_NAMES[message["direction"]])
+        elif op == "pause":
+            if not self.paused:
+                self.paused = True
+                self.pause_start_ms = self.host.now_ms()
+        elif op == "resume":
+            if self.paused:
+                self.start_ms += self.host.now_ms() - self.pause_start_ms
+                self.paused = False
+        elif op == "restart":
+            self.new_round()
+        elif op == "difficulty":
+            if message["difficulty"] not in DIFFICULTIES:
+                raise ValueError(f"unknown difficulty {message['difficulty']!r}")
+            self.difficulty = message["difficulty"]
+            self.new_round()
+        else:
+            raise ValueError(f"unknown op {op!r}")
+
+    def step(self):
+        """One logic tick; returns the finished message when the round completes."""
+        if self.round is None or self.paused:
+            return None
+        outcome = self.round.step()
+        if outcome in (rsa_engine.ATE, rsa_engine.CRASHED, rsa_engine.CLEARED):
+            self.food_changed = self.info_changed = True
+        if self.round.completed:
+            seconds = self.elapsed_ms(self.host.now_ms()) / 1000.0
+            finished = {"op": "finished", "seconds": seconds, "verified": self.round.verified}
+            if self.round.verified and self.host.ranked:
+                self.host.board.record(self.player, self.difficulty, seconds)
+                finished["rank"] = self.host.board.rank(self.difficulty, self.player)
+            self.new_round()
+            return finished
+        return None
+
+    def state(self, now_ms):
+        game_round = self.round
+        stage = game_round.stage
+        message = {"op": "state", "tick": game_round.ticks, "elapsed": self.elapsed_ms(now_ms),
+                   "stage": stage.number, "paused": self.paused, "snake": list(stage.snake.cells)}
+        if self.food_changed:
+            message["food"] = [[index, rsa_game.format_food(value)] for index, value in stage.food.items()]
+            if self.hints:
+                message["goal"] = [index for index, value in stage.food.items() if stage.is_correct(value)]
+            self.food_changed = False
+        if self.info_changed:
+            # The last line is the timer, which the client draws from "elapsed".
+            message["info"] = rsa_game.STAGE_INFO[stage.number](stage, 0.0)[:-1]
+            self.info_changed = False
+        return message
+
+    def send(self, message):
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.skipped += 1
+            if message["op"] == "state":
+                # Resend food and info once the client has caught up.
+                self.food_changed = self.info_changed = True
+            return
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    def watch(self, writer):
+        if self.encoder is None:
+            self.encoder = statestream.StateEncoder()
+        self.encoder.request_keyframe()
+        self.watchers.append(writer)
+
+    def broadcast(self, now_ms):
+        """Send the spectators this tick's frame (also while paused, so they see it)."""
+        if not self.watchers or self.round is None:
+            return
+        frame = self.encoder.encode(self.round, self.elapsed_ms(now_ms), self.paused)
+        if frame is None:
+            return
+        data = statestream.pack(frame)
+        for writer in self.watchers:
+            if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                # This spectator misses a frame; the next keyframe puts it back in sync.
+                self.encoder.request_keyframe()
+            else:
+                writer.write(data)
+
+    def close(self):
+        if self._starting is not None:
+            self._starting.cancel()
+        for writer in self.watchers:
+            writer.close()
+
+class SessionHost:
+    """Accepts clients, one Session each, and ticks every running session."""
+
+    def __init__(self, board, key_pool, logic_hz=LOGIC_HZ):
+        self.board = board
+        self.key_pool = key_pool
+        self.tick_ms = 1000.0 / logic_hz
+        self.ranked = logic_hz == LOGIC_HZ   # Other rates would skew the shared board.
+        self.sessions = set()
+        self.tick_work = frameprof.Histogram()   # Seconds to step and send all sessions, per tick.
+        self.ticks = 0
+        self.late_ticks = 0      # Ticks run back to back because the loop fell behind.
+        self._origin = time.perf_counter()
+
+    def now_ms(self):
+        return (time.perf_counter() - self._origin) * 1000.0
+
+    async def handle(self, reader, writer):
+        session = None
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if not isinstance(hello, dict):
+                hello = {}
+            if hello.get("op") == "watch":
+                await self.spectate(hello.get("player"), reader, writer)
+                return
+            if hello.get("op") != "hello" or hello.get("difficulty", "easy") not in DIFFICULTIES:
+                writer.write(b'{"error":"expected hello"}\n')
+                return
+            session = Session(self, writer, str(hello.get("player", "player")), hello.get("difficulty", "easy"),
+                              bool(hello.get("hints")))
+            self.sessions.add(session)
+            session.new_round()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    session.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    writer.write(json.dumps({"error": str(error)}).encode() + b"\n")
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if session is not None:
+                session.close()
+                self.sessions.discard(session)
+            writer.close()
+
+    async def spectate(self, player, reader, writer):
+        session = next((s for s in self.sessions if s.player == player), None)
+        if session is None:
+            writer.write(json.dumps({"error": f"no session for {player!r}"}).encode() + b"\n")
+            return
+        writer.write(b'{"op":"watching"}\n')
+        session.watch(writer)
+        try:
+            await reader.read()   # Spectators only listen; wait for them to hang up.
+        finally:
+            if writer in session.watchers:
+                session.watchers.remove(writer)
+
+    def tick(self):
+        began = time.perf_counter()
+        now_ms = self.now_ms()
+        for session in self.sessions:
+            finished = session.step()
+            if finished is not None:
+                session.send(finished)
+            elif session.round is not None:
+                session.send(session.state(now_ms))
+            session.broadcast(now_ms)
+        self.ticks += 1
+        self.tick_work.observe(time.perf_counter() - began)
+
+    async def run(self):
+        """Step every session LOGIC_HZ times per second, catching up after stalls."""
+        timestep = rsa_engine.FixedTimestep(self.tick_ms)
+        timestep.reset(self.now_ms())
+        while True:
+            due = timestep.advance(self.now_ms())
+            self.late_ticks += max(0, due - 1)
+            for _ in range(due):
+                self.tick()
+            await asyncio.sleep(max(0.0, self.tick_ms - timestep.accumulated) / 1000.0)
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Start listening and ticking; returns the asyncio Server (port 0 picks a free port)."""
+        self._ticker = asyncio.ensure_future(self.run())
+        return await asyncio.start_server(self.handle, host, port, backlog=4096, limit=1 << 20)
+
+    def stop(self):
+        self._ticker.cancel()
+        for session in self.sessions:
+            session.close()
+
+    def report(self):
+        return (f"Session host: {len(self.sessions)} sessions, {self.ticks} ticks ({self.late_ticks} late), "
+                f"tick work p50 {self.tick_work.quantile(0.5) * 1000:.1f} ms, "
+                f"p99 {self.tick_work.quantile(0.99) * 1000:.1f} ms, max {self.tick_work.max * 1000:.1f} ms")
+
+async def serve(host, port, db_path, logic_hz=LOGIC_HZ):
+    board = scoreboard.Scoreboard(db_path).start()
+    pool = keypool.KeyPool().start()
+    session_host = SessionHost(board, pool, logic_hz)
+    try:
+        server = await session_host.start(host, port)
+        print(f"Session host listening on {host}:{server.sockets[0].getsockname()[1]}")
+        if not session_host.ranked:
+            print(f"Ticking at {logic_hz:g} Hz instead of {LOGIC_HZ}: round times are not recorded.")
+        async with server:
+            await server.serve_forever()
+    finally:
+        session_host.stop()
+        print(session_host.report())
+        pool.close()
+        board.close()
+
+# -------------------------------------------------------------------
+# Clients
+
+def draw_state(view, title=""):
+    """Draw a state message's board in rsa_game's window (see rsa_game.init_display)."""
+    screen = rsa_game.init_display()
+    screen.fill(rsa_game.BLACK)
+    timer = f"{rsa_game.TIMER_LABEL}{view['elapsed'] / 1000.0:.2f} seconds"
+    if view["paused"]:
+        timer += "  (paused)"
+    rsa_game.draw_info_section(view["info"] + [timer + (f"  {title}" if title else "")])
+    snake = rsa_engine.Snake()
+    snake.cells.extend(view["snake"])
+    rsa_game.draw_snake(snake)
+    rsa_game.draw_food([rsa_engine.cell_position(cell) for cell, _ in view["food"]],
+                       [label for _, label in view["food"]])
+    rsa_game.pygame.display.flip()
+
+async def play(host, port, player, difficulty):
+    """Play a round on a session host: arrow keys steer, P pauses and resumes,
+       R restarts, Escape quits. The host runs the round; this only draws it."""
+    import pygame
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    writer.write(json.dumps({"op": "hello", "player": player, "difficulty": difficulty}).encode() + b"\n")
+    rsa_game.init_display()
+    view = {"info": [], "food": []}
+    title = ""
+
+    def send(message):
+        writer.write(json.dumps(message).encode() + b"\n")
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                print("The session host closed the connection")
+                return
+            message = json.loads(line)
+            if message.get("op") == "finished":
+                title = (f"(last round {message['seconds']:.2f}s, #{message['rank']})" if "rank" in message
+                         else "(last round failed to decrypt)")
+            elif message.get("op") == "state":
+                view.update(message)
+                draw_state(view, title)
+            elif "error" in message:
+                print(message["error"])
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return
+                if event.type != pygame.KEYDOWN:
+                    continue
+                if event.key in rsa_game.KEY_DIRECTIONS:
+                    send({"op": "turn", "direction": NAMES_OF_DIRECTIONS[rsa_game.KEY_DIRECTIONS[event.key]]})
+                elif event.key == pygame.K_p:
+                    send({"op": "resume" if view.get("paused") else "pause"})
+                elif event.key == pygame.K_r:
+                    send({"op": "restart"})
+    finally:
+        writer.close()
+
+def steer(snake, food, direction):
+    """Direction towards the nearest food that does not hit the snake or a wall, or None."""
+    if not snake or not food:
+        return None
+    head_y, head_x = divmod(snake[0], COLS)
+    target = min(food, key=lambda cell: abs(cell % COLS - head_x) + abs(cell // COLS - head_y))
+    target_y, target_x = divmod(target, COLS)
+    body = set(snake)
+    best, best_distance = None, None
+    for name, (dx, dy) in DIRECTION_NAMES.items():
+        if direction is not None and (dx, dy) == OPPOSITE[DIRECTION_NAMES[direction]]:
+            continue
+        x, y = head_x + dx, head_y + dy
+        if not (0 <= x < COLS and 0 <= y < ROWS) or y * COLS + x in body:
+            continue
+        distance = abs(target_x - x) + abs(target_y - y)
+        if best is None or distance < best_distance:
+            best, best_distance = name, distance
+    return best
+
+async def bot(host, port, player, difficulty, stats):
+    """A thin client that asks for hints and steers towards the nearest correct
+       food, so it clears stages and finishes rounds, until cancelled."""
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    writer.write(json.dumps({"op": "hello", "player": player, "difficulty": difficulty,
+                             "hints": True}).encode() + b"\n")
+    food, direction, head = [], None, None
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            stats["messages"] += 1
+            stats["bytes"] += len(line)
+            if message.get("op") == "finished":
+                stats["finished"] += 1
+                stats["ranked"] += "rank" in message
+                food, direction, head = [], None, None
+                continue
+            if message.get("op") != "state":
+                continue
+            if "food" in message:
+                food = message.get("goal") or [cell for cell, _ in message["food"]]
+            if message["tick"] == 0 or message["snake"][0] == head:
+                # A new round, or a crash reset the stage: the snake waits for a turn.
+                direction = None
+            head = message["snake"][0]
+            turn = steer(message["snake"], food, direction)
+            if turn is not None and turn != direction:
+                direction = turn
+                writer.write(json.dumps({"op": "turn", "direction": turn}).encode() + b"\n")
+    finally:
+        writer.close()
+
+def run_bots(host, port, count, difficulty, seconds, results):
+    """Client process for the benchmark: `count` bots for `seconds`."""
+    async def main():
+        stats = {"messages": 0, "bytes": 0, "finished": 0, "ranked": 0}
+        tasks = [asyncio.ensure_future(bot(host, port, f"bot{i}", difficulty, stats)) for i in range(count)]
+        await asyncio.sleep(seconds)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        results.put(stats)
+    asyncio.run(main())
+
+async def bench_sessions(count, difficulty, seconds, pool):
+    board = scoreboard.Scoreboard(os.path.join(tempfile.mkdtemp(), "sessions.db")).start()
+    session_host = SessionHost(board, pool)
+    server = await session_host.start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    context = multiprocessing.get_context("spawn")   # Not a fork of a running event loop.
+    results = context.Queue()
+    clients = context.Process(target=run_bots, args=("127.0.0.1", port, count, difficulty,
+                                                              seconds + 2, results))
+    clients.start()
+    # Let every client connect and start its round before measuring.
+    while len(session_host.sessions) < count or any(s.round is None for s in session_host.sessions):
+        await asyncio.sleep(0.1)
+    session_host.tick_work = frameprof.Histogram()
+    ticks, late = session_host.ticks, session_host.late_ticks
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    ticks, late = session_host.ticks - ticks, session_host.late_ticks - late
+    work = session_host.tick_work
+    stats = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    clients.join()
+    session_host.stop()
+    server.close()
+    await server.wait_closed()
+    board.close()
+
+    # Host CPU per session-second, so the client process sharing the machine does not count.
+    per_session = cpu / wall / count
+    print(f"{count:5} sessions: {ticks / wall:5.1f} ticks/s ({late} late), "
+          f"tick work p50 {work.quantile(0.5) * 1000:6.2f} ms p99 {work.quantile(0.99) * 1000:6.2f} ms, "
+          f"host CPU {cpu / wall * 100:5.1f}% -> ~{1 / per_session:5.0f} sessions per core, "
+          f"{stats['bytes'] / max(stats['messages'], 1):.0f} B/state, {stats['finished']} rounds finished "
+          f"({stats['ranked']} ranked)")
+
+async def bench(args):
+    pool = keypool.KeyPool().start()
+    try:
+        for count in args.sessions:
+            await bench_sessions(count, args.difficulty, args.seconds, pool)
+    finally:
+        pool.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many RSA Snake sessions in one process.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the session host")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--db", default=scoreboard.DB_PATH)
+    serve_parser.add_argument("--logic-hz", type=float, default=LOGIC_HZ)
+    bench_parser = commands.add_parser("bench", help="measure how many sessions one core sustains")
+    bench_parser.add_argument("--sessions", type=int, nargs="+", default=[50, 100, 200, 400])
+    bench_parser.add_argument("--difficulty", choices=DIFFICULTIES, default="medium")
+    bench_parser.add_argument("--seconds", type=float, default=30.0,
+                              help="measured time per run; a bot round takes about 20 s at 10 ticks/s")
+    play_parser = commands.add_parser("play", help="play a round on a session host")
+    play_parser.add_argument("--host", default="127.0.0.1")
+    play_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    play_parser.add_argument("--player", required=True)
+    play_parser.add_argument("--difficulty", choices=DIFFICULTIES, default="easy")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.db, args.logic_hz))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "play":
+        asyncio.run(play(args.host, args.port, args.player, args.difficulty))
+    else:
+        asyncio.run(bench(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Delta-compressed game state stream for spectators and remote rendering.
+
+A StateEncoder turns a running Round into one small binary frame per logic
+tick; a StateDecoder applies the frames to its own copy of the board, which
+render() draws with rsa_game's draw_* helpers. A frame starts with a flags
+byte:
+
+    bits 0-1  direction of the new head from the old one (COMPASS order)
+    bit 2     MOVED     the head advanced one cell
+    bit 3     GREW      ... and the tail stayed (something was eaten)
+    bit 4     FOOD      the food list follows (respawned or changed)
+    bit 5     INFO      the stage number and the info lines that changed follow
+    bit 6     PAUSED    the round is paused (the tick counter does not advance)
+    bit 7     KEYFRAME  the whole state follows: tick, snake, food and info
+
+then the timer as a varint of milliseconds since the previous frame. A plain
+move costs two bytes. Keyframes are sent every KEYFRAME_INTERVAL ticks, after
+a crash or a new round, and whenever a new spectator joins; a keyframe's
+snake is its head plus 2-bit steps to each following cell.
+
+    python statestream.py bench --rounds 50 --difficulty hard
+    python statestream.py watch --player alice       # spectate on a session host
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import rsa_engine
+import rsa_game
+from rsa_engine import COLS, cell_position
+from replay import COMPASS, COMPASS_INDEX
+
+KEYFRAME_INTERVAL = 50   # Ticks between keyframes (5 s at 10 ticks per second).
+
+MOVED, GREW, FOOD, INFO, PAUSED, KEYFRAME = 0x04, 0x08, 0x10, 0x20, 0x40, 0x80
+DIRECTION_MASK = 0x03
+RAW_SNAKE = 1            # Low bit of a keyframe's snake length: cells follow as varints.
+
+# Cell index offset of one step in each COMPASS direction.
+STEPS = tuple(dy * COLS + dx for dx, dy in COMPASS)
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def write_text(out, text):
+    data = text.encode("utf-8")
+    write_varint(out, len(data))
+    out += data
+
+def read_text(data, offset):
+    length, offset = read_varint(data, offset)
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+def step_direction(from_cell, to_cell):
+    """COMPASS index of the step between two neighbouring cells, or None."""
+    row, col = divmod(from_cell, COLS)
+    to_row, to_col = divmod(to_cell, COLS)
+    return COMPASS_INDEX.get((to_col - col, to_row - row))
+
+def stage_info(stage):
+    """The stage's info panel lines without the timer line (spectators draw that)."""
+    return rsa_game.STAGE_INFO[stage.number](stage, 0.0)[:-1]
+
+# -------------------------------------------------------------------
+# Encoder
+
+class StateEncoder:
+    """Frames for one round's spectators. Call encode() after every logic tick
+       (and whenever the round is paused or resumed)."""
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, info=stage_info):
+        self.keyframe_interval = keyframe_interval
+        self.info = info
+        self.frames = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self._round = None
+        self._keyframe_due = True
+
+    def request_keyframe(self):
+        """Make the next frame a keyframe, e.g. for a spectator who just joined."""
+        self._keyframe_due = True
+
+    def _write_food(self, out, stage):
+        write_varint(out, len(stage.food))
+        for index, value in stage.food.items():
+            write_varint(out, index)
+            write_text(out, rsa_game.format_food(value))
+
+    def _write_info(self, out, stage, lines, previous=()):
+        """Stage number, line count, then (index, text) for each line not in `previous`."""
+        out.append(stage.number)
+        write_varint(out, len(lines))
+        changed = [i for i, line in enumerate(lines) if i >= len(previous) or line != previous[i]]
+        write_varint(out, len(changed))
+        for i in changed:
+            out.append(i)
+            write_text(out, lines[i])
+
+    def _keyframe(self, game_round, elapsed_ms, paused):
+        stage = game_round.stage
+        cells = stage.snake.cells
+        out = bytearray([KEYFRAME | FOOD | INFO | (PAUSED if paused else 0)])
+        write_varint(out, game_round.ticks)
+        write_varint(out, int(elapsed_ms))
+        steps = [step_direction(a, b) for a, b in zip(cells, list(cells)[1:])]
+        if None in steps:
+            write_varint(out, len(cells) << 1 | RAW_SNAKE)
+            for index in cells:
+                write_varint(out, index)
+        else:
+            write_varint(out, len(cells) << 1)
+            write_varint(out, cells[0])
+            for i in range(0, len(steps), 4):
+                byte = 0
+                for shift, step in enumerate(steps[i:i + 4]):
+                    byte |= step << (2 * shift)
+                out.append(byte)
+        self._write_food(out, stage)
+        lines = self.info(stage)
+        self._write_info(out, stage, lines)
+        self._round, self._stage, self._crashes = game_round, stage, game_round.crashes
+        self._ticks, self._elapsed, self._paused = game_round.ticks, int(elapsed_ms), paused
+        self._head, self._length = cells[0], len(cells)
+        self._food, self._lines = dict(stage.food), lines
+        self._since_keyframe = 0
+        self._keyframe_due = False
+        self.keyframes += 1
+        return out
+
+    def encode(self, game_round, elapsed_ms, paused=False):
+        """Return the frame for the round's current state, or None if nothing changed."""
+        stage = game_round.stage
+        cells = stage.snake.cells
+        ticks = game_round.ticks - (self._ticks if self._round is game_round else 0)
+        if (self._keyframe_due or game_round is not self._round or game_round.crashes != self._crashes
+                or self._since_keyframe >= self.keyframe_interval or ticks not in (0, 1)
+                or (ticks == 0) != paused):
+            frame = self._keyframe(game_round, elapsed_ms, paused)
+        else:
+            flags = PAUSED if paused else 0
+            if cells[0] != self._head:
+                direction = step_direction(self._head, cells[0])
+                if direction is None:
+                    return self._count(self._keyframe(game_round, elapsed_ms, paused))
+                flags |= MOVED | direction
+                if len(cells) > self._length:
+                    flags |= GREW
+            food_changed = stage.food != self._food
+            if food_changed:
+                flags |= FOOD
+            lines = None
+            if food_changed or stage is not self._stage:
+                lines = self.info(stage)
+                if lines != self._lines or stage.number != self._stage.number:
+                    flags |= INFO
+            elapsed = int(elapsed_ms)
+            if not ticks and flags == (PAUSED if paused else 0) and paused == self._paused \
+                    and elapsed == self._elapsed:
+                return None
+            frame = bytearray([flags])
+            write_varint(frame, max(0, elapsed - self._elapsed))
+            if flags & FOOD:
+                self._write_food(frame, stage)
+                self._food = dict(stage.food)
+            if flags & INFO:
+                self._write_info(frame, stage, lines, self._lines)
+                self._lines = lines
+            self._stage, self._ticks, self._paused = stage, game_round.ticks, paused
+            self._elapsed = max(elapsed, self._elapsed)
+            self._head, self._length = cells[0], len(cells)
+            self._since_keyframe += ticks
+        return self._count(frame)
+
+    def _count(self, frame):
+        self.frames += 1
+        self.bytes += len(frame)
+        return bytes(frame)
+
+# -------------------------------------------------------------------
+# Decoder and renderer
+
+class StateDecoder:
+    """A spectator's copy of the board, rebuilt from frames. Frames before the
+       first keyframe are ignored."""
+
+    def __init__(self):
+        self.synced = False
+        self.tick = 0
+        self.elapsed_ms = 0
+        self.paused = False
+        self.stage = 0
+        self.info = []
+        self.snake = rsa_engine.Snake()
+        self.food = []            # [(cell, label), ...]
+        self.food_positions = []  # Pixel positions and labels, for rsa_game.draw_food.
+        self.food_values = []
+
+    def _read_food(self, data, offset):
+        count, offset = read_varint(data, offset)
+        food = []
+        for _ in range(count):
+            index, offset = read_varint(data, offset)
+            label, offset = read_text(data, offset)
+            food.append((index, label))
+        self.food = food
+        self.food_positions = [cell_position(index) for index, _ in food]
+        self.food_values = [label for _, label in food]
+        return offset
+
+    def _read_info(self, data, offset):
+        self.stage = data[offset]
+        count, offset = read_varint(data, offset + 1)
+        lines = (self.info + [""] * count)[:count]
+        changed, offset = read_varint(data, offset)
+        for _ in range(changed):
+            i = data[offset]
+            lines[i], offset = read_text(data, offset + 1)
+        self.info = lines
+        return offset
+
+    def _read_snake(self, data, offset):
+        packed, offset = read_varint(data, offset)
+        length = packed >> 1
+        snake = self.snake = rsa_engine.Snake()
+        if packed & RAW_SNAKE:
+            for _ in range(length):
+                index, offset = read_varint(data, offset)
+                snake.cells.append(index)
+                snake.occupied[index] = 1
+            return offset
+        index, offset = read_varint(data, offset)
+        snake.cells.append(index)
+        snake.occupied[index] = 1
+        for i in range(length - 1):
+            index += STEPS[data[offset + i // 4] >> (2 * (i % 4)) & 3]
+            snake.cells.append(index)
+            snake.occupied[index] = 1
+        return offset + (length + 2) // 4
+
+    def apply(self, frame):
+        """Apply one frame; returns False while waiting for the first keyframe."""
+        flags = frame[0]
+        if flags & KEYFRAME:
+            self.tick, offset = read_varint(frame, 1)
+            self.elapsed_ms, offset = read_varint(frame, offset)
+            offset = self._read_snake(frame, offset)
+            self.synced = True
+        elif not self.synced:
+            return False
+        else:
+            delta, offset = read_varint(frame, 1)
+            self.elapsed_ms += delta
+            if not flags & PAUSED:
+                self.tick += 1
+            if flags & MOVED:
+                snake = self.snake
+                snake.push_head(snake.cells[0] + STEPS[flags & DIRECTION_MASK])
+                if not flags & GREW:
+                    snake.pop_tail()
+        self.paused = bool(flags & PAUSED)
+        if flags & FOOD:
+            offset = self._read_food(frame, offset)
+        if flags & INFO:
+            offset = self._read_info(frame, offset)
+        return True
+
+def render(decoder, title=""):
+    """Draw the decoded board in rsa_game's window (see rsa_game.init_display)."""
+    screen = rsa_game.init_display()
+    screen.fill(rsa_game.BLACK)
+    timer = f"{rsa_game.TIMER_LABEL}{decoder.elapsed_ms / 1000.0:.2f} seconds"
+    if decoder.paused:
+        timer += "  (paused)"
+    rsa_game.draw_info_section(decoder.info + [timer + (f"  {title}" if title else "")])
+    rsa_game.draw_snake(decoder.snake)
+    rsa_game.draw_food(decoder.food_positions, decoder.food_values)
+    rsa_game.pygame.display.flip()
+
+# -------------------------------------------------------------------
+# Framing on a byte stream: each frame is prefixed with its varint length.
+
+def pack(frame):
+    out = bytearray()
+    write_varint(out, len(frame))
+    return bytes(out) + frame
+
+async def read_frame(reader):
+    """Read one length-prefixed frame from an asyncio StreamReader."""
+    length = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return await reader.readexactly(length)
+
+async def watch(host, port, player):
+    """Spectate a player's session on a session host until the window is closed."""
+    import json
+    import pygame
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(json.dumps({"op": "watch", "player": player}).encode() + b"\n")
+    reply = json.loads(await reader.readline() or b"{}")
+    if "error" in reply:
+        print(reply["error"])
+        writer.close()
+        return
+    decoder = StateDecoder()
+    rsa_game.init_display()
+    try:
+        while True:
+            frame = await read_frame(reader)
+            if decoder.apply(frame):
+                render(decoder, f"(watching {player})")
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return
+    except asyncio.IncompleteReadError:
+        print(f"{player}'s session ended")
+    finally:
+        writer.close()
+
+# -------------------------------------------------------------------
+# Benchmark
+
+def record(rounds, difficulty, seed):
+    """Play autopilot rounds headless, encoding every tick. Returns the frames,
+       the board (cells, food cells) after each tick, the encoder and the
+       seconds spent in encode()."""
+    rng = random.Random(seed)
+    encoder = StateEncoder()
+    frames, boards = [], []
+    encode_seconds = 0.0
+    clock = time.perf_counter
+    for _ in range(rounds):
+        game_round = rsa_engine.Round(difficulty, random.Random(rng.getrandbits(64)),
+                                      rsa_engine.seeded_key_bundle(difficulty, rng.getrandbits(64)))
+        elapsed = 0
+        while not game_round.completed and game_round.ticks < 20000:
+            for direction in rsa_engine.autopilot(game_round.stage):
+                game_round.stage.turn(direction)
+            game_round.step()
+            elapsed += rsa_engine.TICK_MS
+            began = clock()
+            frames.append(encoder.encode(game_round, elapsed))
+            encode_seconds += clock() - began
+            stage = game_round.stage
+            boards.append((list(stage.snake.cells), sorted(stage.food), stage_info(stage)))
+    return frames, boards, encoder, encode_seconds
+
+def bench(args):
+    frames, boards, encoder, encode_seconds = record(args.rounds, args.difficulty, args.seed)
+    ticks = len(frames)
+    delta_bytes = [len(f) for f in frames if not f[0] & KEYFRAME]
+    moves = sum(1 for f in frames if not f[0] & (KEYFRAME | FOOD | INFO))
+    key_bytes = [len(f) for f in frames if f[0] & KEYFRAME]
+    print(f"{args.rounds} {args.difficulty} rounds: {ticks} ticks, {encoder.bytes / ticks:.2f} bytes per tick "
+          f"({sum(delta_bytes) / max(len(delta_bytes), 1):.2f} per delta, "
+          f"{len(key_bytes)} keyframes of {sum(key_bytes) / max(len(key_bytes), 1):.0f} bytes on average)")
+    print(f"  {moves / ticks:.0%} of ticks are plain moves of 2 bytes; the rest carry food or info changes")
+
+    began = time.perf_counter()
+    decoder = StateDecoder()
+    for frame in frames:
+        decoder.apply(frame)
+    decode_seconds = time.perf_counter() - began
+    print(f"encode: {encode_seconds / ticks * 1e6:.2f} µs per tick ({ticks / encode_seconds:,.0f} frames/s)")
+    print(f"decode: {decode_seconds / ticks * 1e6:.2f} µs per tick ({ticks / decode_seconds:,.0f} frames/s)")
+
+    # The decoded board must match the real one after every tick.
+    decoder = StateDecoder()
+    for frame, (cells, food, info) in zip(frames, boards):
+        decoder.apply(frame)
+        if (list(decoder.snake.cells) != cells or sorted(c for c, _ in decoder.food) != food
+                or decoder.info != info):
+            print(f"decoded state differs at tick {decoder.tick}")
+            return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RSA Snake spectator state stream.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="measure bandwidth and encode/decode throughput")
+    bench_parser.add_argument("--rounds", type=int, default=50)
+    bench_parser.add_argument("--difficulty", choices=("easy", "medium", "hard", "expert"), default="hard")
+    bench_parser.add_argument("--seed", type=int, default=1)
+    watch_parser = commands.add_parser("watch", help="spectate a player on a session host")
+    watch_parser.add_argument("--host", default="127.0.0.1")
+    watch_parser.add_argument("--port", type=int, default=8766)
+    watch_parser.add_argument("--player", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        return bench(args)
+    asyncio.run(watch(args.host, args.port, args.player))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
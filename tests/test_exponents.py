@@ -0,0 +1,54 @@
+import random
+from math import gcd
+
+import pytest
+
+import rsa_engine
+import rsa_math
+
+def prime_pairs():
+    rng = random.Random(7)
+    pairs = [(3, 5), (5, 7), (11, 13), (47, 43)]
+    for low, high, _ in rsa_math.DIFFICULTY_RANGES.values():
+        primes = rsa_math.prime_table(low, high)
+        pairs += [tuple(rng.sample(list(primes), 2)) for _ in range(5)]
+    return pairs
+
+@pytest.mark.parametrize("p, q", prime_pairs())
+@pytest.mark.parametrize("food_count", [4, 7])
+def test_pools_are_exactly_the_coprime_and_shared_numbers(p, q, food_count):
+    phi = (p - 1) * (q - 1)
+    valid, invalid = rsa_engine.exponent_pools(p, q, food_count)
+    upper = min(phi, rsa_engine.EXPONENT_LIMIT)
+    assert valid == [e for e in range(3, upper) if gcd(e, phi) == 1]
+    assert invalid and all(gcd(value, phi) > 1 for value in invalid)
+    assert len(invalid) >= food_count - 1
+
+@pytest.mark.parametrize("p, q", prime_pairs())
+@pytest.mark.parametrize("food_count", [4, 7])
+def test_counts_match_what_options_samples(p, q, food_count):
+    counts = rsa_engine.exponent_counts(p, q, food_count)
+    valid, invalid = rsa_engine.exponent_pools(p, q, food_count)
+    assert counts["valid"] == len(valid) and counts["invalid"] == len(invalid)
+    assert 0 <= counts["widenings"] <= rsa_engine.MAX_WINDOW_WIDENINGS
+
+    valid_e, distractors = rsa_engine.exponent_options(p, q, food_count, random.Random(1))
+    assert len(valid_e) == counts["valid_sampled"] == min(rsa_engine.EXPONENT_CHOICES, len(valid))
+    assert len(distractors) == counts["invalid_sampled"] == food_count - 1
+    assert len(set(valid_e)) == len(valid_e) and set(valid_e) <= set(valid)
+    assert len(set(distractors)) == len(distractors) and set(distractors) <= set(invalid)
+
+def test_terminates_for_expert_sized_keys():
+    rng = random.Random(3)
+    p, q = rsa_math.random_prime(512, rng), rsa_math.random_prime(512, rng)
+    counts = rsa_engine.exponent_counts(p, q, 7)
+    assert counts["invalid"] >= 6 and counts["widenings"] <= rsa_engine.MAX_WINDOW_WIDENINGS
+
+def test_tiny_phi_widens_the_window():
+    # φ(3, 5) = 8: [2, 18] holds enough even numbers, but a huge food count needs widening.
+    counts = rsa_engine.exponent_counts(3, 5, 20)
+    assert counts["widenings"] >= 1 and counts["invalid"] >= 19
+
+def test_gives_up_after_the_widening_bound():
+    with pytest.raises(ValueError):
+        rsa_engine.exponent_pools(3, 5, 10 ** 6)
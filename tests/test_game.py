@@ -0,0 +1,28 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import rsa_engine
+import rsa_game
+
+class FailingPool:
+    """Stands in for keypool.KeyPool after its workers died."""
+
+    def __init__(self, raise_on_take):
+        self.raise_on_take = raise_on_take
+
+    def take(self, difficulty):
+        if self.raise_on_take:
+            raise BrokenProcessPool("a worker died")
+        future = Future()
+        future.set_exception(BrokenProcessPool("a worker died"))
+        return future
+
+@pytest.mark.parametrize("raise_on_take", [False, True])
+def test_take_key_bundle_falls_back_to_a_seeded_bundle(monkeypatch, raise_on_take):
+    monkeypatch.setattr(rsa_game, "key_pool", FailingPool(raise_on_take))
+    bundle = rsa_game.take_key_bundle("easy")
+    assert bundle.seed is not None
+    again = rsa_engine.seeded_key_bundle("easy", bundle.seed)
+    assert (again.n, again.phi, again.valid_e) == (bundle.n, bundle.phi, bundle.valid_e)
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+import replay
+import rsa_engine
+from rsa_engine import UP, DOWN, LEFT, RIGHT
+
+def record_round(difficulty, seed, steer=rsa_engine.autopilot):
+    rng = random.Random(seed)
+    round_seed, bundle_seed = rng.getrandbits(64), rng.getrandbits(64)
+    recorder = replay.ReplayRecorder(difficulty, round_seed, bundle_seed, player="tester")
+    result = rsa_engine.run_round(difficulty, steer, rng=random.Random(round_seed),
+                                  bundle=rsa_engine.seeded_key_bundle(difficulty, bundle_seed),
+                                  recorder=recorder)
+    return recorder, result
+
+@pytest.mark.parametrize("difficulty", ["easy", "medium", "hard"])
+@pytest.mark.parametrize("seed", range(3))
+def test_recorded_rounds_replay_to_the_same_end(difficulty, seed):
+    recorder, result = record_round(difficulty, seed)
+    data = recorder.to_bytes(result.elapsed_ms, result.completed)
+    recording = replay.Replay(data)
+    assert (recording.difficulty, recording.player, recording.ticks) == (difficulty, "tester", result.ticks)
+    assert recording.completed == result.completed and recording.claimed_ms == int(result.elapsed_ms)
+    game_round = replay.ReplayPlayer(recording).run()
+    assert game_round.ticks == result.ticks and game_round.completed
+    assert replay.verify(recording)
+
+def test_every_code_kind_round_trips():
+    # Turns both ways, reversals (escaped absolute codes) and straight runs.
+    directions = [None, UP, UP, RIGHT, DOWN, LEFT, RIGHT, RIGHT, UP, DOWN, LEFT, LEFT, DOWN]
+    recorder = replay.ReplayRecorder("easy", 1, 2)
+    previous = None
+    for direction in directions[1:]:
+        recorder.tick(previous, direction)
+        previous = direction
+    recorder.command("pause")
+    recorder.command("resume")
+    recording = replay.Replay(recorder.to_bytes(1234, False))
+    assert recording.commands == [(len(directions) - 1, "pause"), (len(directions) - 1, "resume")]
+
+    codes = recording.code_stream()
+    decoded, current = [], None
+    for _ in range(recording.ticks):
+        code = next(codes)
+        if code == replay.CLOCKWISE:
+            current = replay.COMPASS[(replay.COMPASS_INDEX[current] + 1) % 4]
+        elif code == replay.COUNTER_CLOCKWISE:
+            current = replay.COMPASS[(replay.COMPASS_INDEX[current] - 1) % 4]
+        elif code == replay.ABSOLUTE:
+            current = replay.COMPASS[next(codes)]
+        decoded.append(current)
+    assert decoded == directions[1:]
+
+def test_unseeded_bundle_round_trips():
+    recorder = replay.ReplayRecorder("medium", 99, None, player="ünïcode")
+    recording = replay.Replay(recorder.to_bytes())
+    assert recording.bundle_seed is None and recording.player == "ünïcode" and recording.ticks == 0
+
+@pytest.mark.parametrize("cut", [1, 3, 10])
+def test_truncated_replays_are_malformed(cut):
+    recorder, result = record_round("easy", 5)
+    data = recorder.to_bytes(result.elapsed_ms, True)
+    with pytest.raises(ValueError):
+        replay.Replay(data[:-cut])
+
+def test_tick_count_beyond_the_code_stream_is_malformed():
+    recorder = replay.ReplayRecorder("easy", 1, 2)
+    recorder.ticks = 50
+    with pytest.raises(ValueError):
+        replay.Replay(recorder.to_bytes(5000, True))
+
+def test_foreign_data_is_rejected():
+    with pytest.raises(ValueError):
+        replay.Replay(b"PNG\x00" + bytes(40))
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+import rsa_engine
+import rsa_math
+
+def small_key(difficulty, seed):
+    bundle = rsa_engine.seeded_key_bundle(difficulty, seed)
+    e = bundle.valid_e[0]
+    return bundle, e, bundle.d[e]
+
+@pytest.mark.parametrize("difficulty", ["easy", "medium", "hard"])
+def test_cipher_table_matches_pow(difficulty):
+    bundle, e, _ = small_key(difficulty, 4)
+    table = rsa_math.cipher_table(e, bundle.n)
+    assert table == {c: pow(ord(c), e, bundle.n) for c in rsa_math.CIPHER_ALPHABET}
+    assert rsa_math.cipher_table(e, bundle.n) is table   # Memoized per key.
+
+@pytest.mark.parametrize("difficulty", ["easy", "medium", "hard"])
+def test_memoized_textbook_round_trip(difficulty):
+    bundle, e, d = small_key(difficulty, 9)
+    for word in rsa_engine.VALID_WORDS:
+        encrypted = rsa_math.encrypt_message(word, e, bundle.n, packed=False)
+        assert encrypted == [pow(ord(c), e, bundle.n) for c in word]
+        assert rsa_math.decrypt_message(encrypted, d, bundle.n, packed=False) == word
+        # Second pass is served from the decrypt table.
+        assert rsa_math.decrypt_message(encrypted, d, bundle.n, bundle.crt[e], packed=False) == word
+
+def test_key_tables_are_bounded():
+    rng = random.Random(2)
+    for _ in range(rsa_math.KEY_TABLE_CACHE_SIZE + 10):
+        rsa_math.cipher_table(rng.randrange(3, 1000, 2), 3233)
+    assert len(rsa_math._key_tables) <= rsa_math.KEY_TABLE_CACHE_SIZE
+
+@pytest.fixture(scope="module")
+def expert_key():
+    rng = random.Random(5)
+    p, q = rsa_math.random_prime(512, rng), rsa_math.random_prime(512, rng)
+    phi = (p - 1) * (q - 1)
+    e = 65537
+    d = rsa_math.mod_inverse(e, phi)
+    assert d is not None
+    return p, q, e, d
+
+def test_crt_matches_plain_pow(expert_key):
+    p, q, e, d = expert_key
+    key = rsa_math.crt_params(p, q, d)
+    rng = random.Random(1)
+    for _ in range(20):
+        c = rng.randrange(p * q)
+        assert rsa_math.decrypt_crt(c, key) == pow(c, d, p * q)
+
+@pytest.mark.parametrize("text", ["HELLO", "KEYBOARD", "", "A" * 300, "héllo wörld ✓", "\x00\x00lead"])
+def test_packed_round_trip(expert_key, text):
+    p, q, e, d = expert_key
+    n = p * q
+    blocks = rsa_math.encode_message(text, n)
+    assert all(0 < m < n for m in blocks)
+    assert len(blocks) == -(-len(text.encode()) // rsa_math.block_bytes(n))
+    encrypted = rsa_math.encrypt_message(text, e, n)
+    assert rsa_math.decrypt_message(encrypted, d, n) == text
+    assert rsa_math.decrypt_message(encrypted, d, n, rsa_math.crt_params(p, q, d)) == text
+
+def test_small_moduli_stay_one_character_per_block():
+    bundle, e, d = small_key("hard", 3)
+    assert not rsa_math.is_packed(bundle.n)
+    assert rsa_math.encode_message("PYTHON", bundle.n) == [ord(c) for c in "PYTHON"]
+    encrypted = rsa_math.encrypt_message("PYTHON", e, bundle.n)
+    assert rsa_math.decrypt_message(encrypted, d, bundle.n, bundle.crt[e]) == "PYTHON"
+
+def test_bundle_crt_keys_decrypt_like_d():
+    for difficulty in ("easy", "medium", "hard"):
+        bundle = rsa_engine.seeded_key_bundle(difficulty, 8)
+        for e in bundle.valid_e:
+            d = bundle.d[e]
+            assert e * d % bundle.phi == 1
+            for m in (2, 65, 90):
+                c = pow(m, e, bundle.n)
+                assert rsa_math.decrypt_crt(c, bundle.crt[e]) == pow(c, d, bundle.n) == m
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+import scoreboard
+
+def oracle_order(best):
+    return sorted((seconds, player) for player, seconds in best.items())
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rank_and_top_match_a_sorted_list(seed):
+    rng = random.Random(seed)
+    index = scoreboard.RankedIndex(random.Random(seed))
+    best = {}
+    for step in range(1500):
+        player = f"p{rng.randrange(300)}"
+        seconds = round(rng.uniform(5, 200), rng.choice((0, 1, 2)))   # Rounding makes ties.
+        improved = player not in best or seconds < best[player]
+        assert index.update(player, seconds) == improved
+        if improved:
+            best[player] = seconds
+        if step % 100 == 0 or step == 1499:
+            order = oracle_order(best)
+            assert len(index) == len(order)
+            for rank, (_, name) in enumerate(order, 1):
+                assert index.rank(name) == rank
+            for offset in (0, 1, 7, len(order) - 3, len(order), len(order) + 5):
+                for limit in (1, scoreboard.PAGE_SIZE, 1000):
+                    expected = [(name, s) for s, name in order[max(offset, 0):max(offset, 0) + limit]]
+                    assert index.top(limit, max(offset, 0)) == expected
+    assert index.rank("nobody") is None
+
+def test_empty_index():
+    index = scoreboard.RankedIndex()
+    assert len(index) == 0 and index.top() == [] and index.rank("x") is None
+
+def test_scoreboard_keeps_best_times_across_restarts(tmp_path):
+    path = str(tmp_path / "board.db")
+    board = scoreboard.Scoreboard(path).start()
+    board.record("ann", "easy", 30.0)
+    board.record("ann", "easy", 40.0)   # Slower: not a new best.
+    board.record("bob", "easy", 20.0)
+    board.record("cy", "hard", 50.0)
+    assert board.standing("easy", "ann") == (2, 2)
+    board.close()
+
+    board = scoreboard.Scoreboard(path).start()
+    try:
+        assert board.top("easy") == [("bob", 20.0), ("ann", 30.0)]
+        assert board.top("hard") == [("cy", 50.0)]
+        assert board.rank("easy", "ann") == 2 and board.count("medium") == 0
+    finally:
+        board.close()
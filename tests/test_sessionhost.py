@@ -0,0 +1,55 @@
+import asyncio
+import random
+from concurrent.futures import Future
+
+import pytest
+
+import rsa_engine
+import sessionhost
+
+class Board:
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, player, difficulty, seconds):
+        self.recorded.append((player, difficulty, seconds))
+
+    def rank(self, difficulty, player):
+        return 1
+
+class Pool:
+    def take(self, difficulty):
+        future = Future()
+        future.set_result(rsa_engine.seeded_key_bundle(difficulty, 7))
+        return future
+
+def finish_one_round(logic_hz):
+    """Autopilot one session to the end of a round; returns the board and the
+       host's finished message."""
+    async def play():
+        board = Board()
+        host = sessionhost.SessionHost(board, Pool(), logic_hz)
+        session = sessionhost.Session(host, None, "tester", "easy")
+        session.new_round()
+        await session._starting
+        session.round.rng = random.Random(1)
+        for _ in range(20000):
+            for direction in rsa_engine.autopilot(session.round.stage):
+                session.round.stage.turn(direction)
+            finished = session.step()
+            if finished is not None:
+                session._starting.cancel()
+                return board, finished
+        pytest.fail("the autopilot never finished the round")
+    return asyncio.run(play())
+
+def test_default_rate_records_verified_rounds():
+    board, finished = finish_one_round(sessionhost.LOGIC_HZ)
+    assert finished["verified"] and finished["rank"] == 1
+    assert [entry[:2] for entry in board.recorded] == [("tester", "easy")]
+
+@pytest.mark.parametrize("logic_hz", [5, 12.5, 30])
+def test_other_rates_record_nothing(logic_hz):
+    board, finished = finish_one_round(logic_hz)
+    assert finished["verified"] and "rank" not in finished
+    assert board.recorded == []
@@ -0,0 +1,66 @@
+import pytest
+
+import replay
+import rsa_engine
+import verifier
+
+@pytest.fixture(scope="module")
+def genuine():
+    return verifier.record_rounds(3, "easy", seed=11)
+
+def forge(data, tick_ms=None, claimed_ms=None, ticks=None, completed=True, codes=None):
+    recording = replay.Replay(data)
+    forged = replay.ReplayRecorder(recording.difficulty, recording.round_seed, recording.bundle_seed,
+                                   recording.tick_ms if tick_ms is None else tick_ms, "cheater")
+    forged.ticks = recording.ticks if ticks is None else ticks
+    forged.codes = bytearray(recording.codes if codes is None else codes)
+    claimed = recording.ticks * rsa_engine.TICK_MS if claimed_ms is None else claimed_ms
+    return forged.to_bytes(claimed, completed)
+
+def test_genuine_replays_are_accepted_at_their_ticks_time(genuine):
+    for data in genuine:
+        verdict = verifier.check(data)
+        assert verdict.accepted, verdict.reason
+        assert verdict.seconds == replay.Replay(data).ticks * rsa_engine.TICK_MS / 1000.0
+
+def test_the_ranked_time_ignores_the_claimed_one(genuine):
+    verdict = verifier.check(forge(genuine[0], claimed_ms=10 ** 9))
+    assert verdict.accepted and verdict.seconds == replay.Replay(genuine[0]).ticks * rsa_engine.TICK_MS / 1000.0
+
+@pytest.mark.parametrize("tick_ms", [float("nan"), float("inf"), float("-inf"), 50.0, 200.0, 0.0])
+@pytest.mark.parametrize("claimed_ms", [0, None])
+def test_non_standard_tick_rates_are_rejected(genuine, tick_ms, claimed_ms):
+    verdict = verifier.check(forge(genuine[0], tick_ms=tick_ms, claimed_ms=claimed_ms))
+    assert not verdict.accepted
+
+@pytest.mark.parametrize("claimed_ms", [0, 1000])
+def test_impossibly_short_claims_are_rejected(genuine, claimed_ms):
+    assert not verifier.check(forge(genuine[0], claimed_ms=claimed_ms)).accepted
+
+def test_tampered_replays_are_rejected(genuine):
+    data = genuine[0]
+    recording = replay.Replay(data)
+    assert not verifier.check(verifier.tamper(data)).accepted
+    assert not verifier.check(forge(data, completed=False)).accepted
+    flipped = bytearray(recording.codes)
+    flipped[len(flipped) // 2] ^= 0b01
+    assert not verifier.check(forge(data, codes=flipped)).accepted
+
+def test_ticks_beyond_the_code_stream_are_rejected(genuine):
+    recording = replay.Replay(genuine[0])
+    verdict = verifier.check(forge(genuine[0], ticks=recording.ticks + 50))
+    assert not verdict.accepted and "unreadable" in verdict.reason
+
+def test_garbage_is_rejected_not_raised():
+    for data in (b"", b"RSRP", b"RSRP\x01" + bytes(100), bytes(range(256))):
+        assert not verifier.check(data).accepted
+
+def test_farm_matches_in_process_checks(genuine):
+    replays = genuine + [verifier.tamper(genuine[1])]
+    farm = verifier.VerificationFarm(1).start()
+    try:
+        verdicts = farm.verify_many(replays)
+        assert [v.accepted for v in verdicts] == [True, True, True, False]
+        assert farm.submit(forge(genuine[2], tick_ms=float("nan"))).result(timeout=30).accepted is False
+    finally:
+        farm.close()
@@ -0,0 +1,208 @@
+"""
+Replay verification farm.
+
+A submitted time is only trusted if its replay reproduces it: a worker
+process rebuilds the round from the recorded seeds, re-simulates every tick
+with the same stage rules (rsa_engine), and accepts the time only if the
+round completes, decrypts correctly, ends on the recorded tick, ran at the
+standard logic rate and took at least as long as its ticks allow. The
+ranked time is the ticks' worth of play, not the time the client claims.
+
+    python verifier.py verify replays/*.rsr
+    python verifier.py bench --replays 2000 --difficulty hard
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import replay
+import rsa_engine
+
+CHUNK_SIZE = 32   # Replays handed to a worker at a time by verify_many.
+MAX_TICKS = 18000   # 30 minutes of play; longer replays are not re-simulated.
+
+class Verdict:
+    """Outcome of verifying one replay."""
+
+    __slots__ = ("accepted", "reason", "player", "difficulty", "seconds")
+
+    def __init__(self, accepted, reason, player="", difficulty="", seconds=0.0):
+        self.accepted = accepted
+        self.reason = reason
+        self.player = player
+        self.difficulty = difficulty
+        self.seconds = seconds
+
+    def __repr__(self):
+        return (f"Verdict({'accepted' if self.accepted else 'rejected'}: {self.reason}, "
+                f"{self.player}, {self.difficulty}, {self.seconds:.2f}s)")
+
+def check(data):
+    """Verify one replay file's bytes; returns a Verdict. Runs in the workers."""
+    try:
+        recording = replay.Replay(data)
+    except Exception as error:
+        return Verdict(False, f"unreadable replay: {error!r}")
+    verdict = Verdict(False, "", recording.player, recording.difficulty,
+                      recording.ticks * rsa_engine.TICK_MS / 1000.0)
+    if not recording.completed:
+        verdict.reason = "round was not completed"
+    elif not (math.isfinite(recording.tick_ms) and recording.tick_ms == rsa_engine.TICK_MS):
+        # Comparisons with NaN or inf are all False, so test for the one valid rate.
+        verdict.reason = f"logic did not run at the standard rate ({recording.tick_ms:g} ms per tick)"
+    elif not 0 < recording.ticks <= MAX_TICKS:
+        verdict.reason = f"{recording.ticks} ticks is outside 1..{MAX_TICKS}"
+    elif recording.claimed_ms <= 0 or recording.claimed_ms + recording.tick_ms < recording.ticks * recording.tick_ms:
+        verdict.reason = f"claimed time is shorter than {recording.ticks} ticks allow"
+    else:
+        try:
+            game_round = replay.ReplayPlayer(recording).run()
+        except Exception as error:
+            # A forged header or code stream must cost its sender the score,
+            # never the worker or the server waiting on it.
+            verdict.reason = f"replay could not be played back: {error!r}"
+            return verdict
+        if not game_round.completed:
+            verdict.reason = f"replay did not finish (stage {game_round.stage.number} at tick {game_round.ticks})"
+        elif game_round.ticks != recording.ticks:
+            verdict.reason = f"finished at tick {game_round.ticks}, recorded {recording.ticks}"
+        elif not game_round.verified:
+            verdict.reason = "decryption did not reproduce the plaintext"
+        else:
+            verdict.accepted = True
+            verdict.reason = "reproduced"
+    return verdict
+
+class VerificationFarm:
+    """Verifies replays on a process pool (one worker per core by default)."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self.accepted = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _count(self, verdict):
+        if verdict.accepted:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+        return verdict
+
+    def submit(self, data):
+        """Queue one replay; returns a Future for its Verdict."""
+        if self._executor is None:
+            self.start()
+        future = self._executor.submit(check, data)
+        future.add_done_callback(lambda f: f.exception() is None and self._count(f.result()))
+        return future
+
+    def verify_many(self, replays, chunk_size=CHUNK_SIZE):
+        """Verify a list of replay bytes; returns the Verdicts in order."""
+        if self._executor is None:
+            self.start()
+        return [self._count(verdict) for verdict in self._executor.map(check, replays, chunksize=chunk_size)]
+
+    def report(self):
+        return f"Verification: {self.accepted} accepted, {self.rejected} rejected"
+
+# -------------------------------------------------------------------
+# Benchmark
+
+def record_rounds(count, difficulty, seed=None):
+    """Play `count` autopilot rounds headless and return their replay bytes."""
+    rng = random.Random(seed)
+    replays = []
+    for _ in range(count):
+        round_seed, bundle_seed = rng.getrandbits(64), rng.getrandbits(64)
+        recorder = replay.ReplayRecorder(difficulty, round_seed, bundle_seed, player="bench")
+        result = rsa_engine.run_round(difficulty, rsa_engine.autopilot, rng=random.Random(round_seed),
+                                      bundle=rsa_engine.seeded_key_bundle(difficulty, bundle_seed),
+                                      recorder=recorder)
+        replays.append(recorder.to_bytes(result.elapsed_ms, result.completed))
+    return replays
+
+def tamper(data):
+    """Return a copy of a replay claiming a time one tick shorter than possible."""
+    recording = replay.Replay(data)
+    forged = replay.ReplayRecorder(recording.difficulty, recording.round_seed, recording.bundle_seed,
+                                   recording.tick_ms, recording.player)
+    forged.ticks = recording.ticks
+    forged.codes = bytearray(recording.codes)
+    return forged.to_bytes((recording.ticks - 2) * recording.tick_ms, True)
+
+def bench(args):
+    print(f"Recording {args.replays} {args.difficulty} replays...")
+    replays = record_rounds(args.replays, args.difficulty, args.seed)
+    replays.append(tamper(replays[0]))
+    print(f"  {sum(map(len, replays)) / len(replays):.0f} bytes per replay on average")
+
+    began = time.perf_counter()
+    inline = [check(data) for data in replays]
+    inline_rate = len(replays) / (time.perf_counter() - began)
+    print(f"in-process:      {inline_rate:8.0f} replays/s")
+
+    farm = VerificationFarm(args.workers).start()
+    try:
+        farm.verify_many(replays[:farm.workers])   # Warm the workers up.
+        began = time.perf_counter()
+        verdicts = farm.verify_many(replays)
+        wall = time.perf_counter() - began
+    finally:
+        farm.close()
+    rate = len(replays) / wall
+    print(f"farm ({farm.workers} workers): {rate:8.0f} replays/s, {rate / farm.workers:.0f} per worker")
+    accepted = sum(v.accepted for v in verdicts)
+    print(f"accepted {accepted}, rejected {len(verdicts) - accepted} "
+          f"(the forged replay: {verdicts[-1].reason})")
+    if [v.accepted for v in verdicts] != [v.accepted for v in inline]:
+        print("farm and in-process verdicts differ!")
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify RSA Snake replays on a process pool.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    verify_parser = commands.add_parser("verify", help="verify replay files")
+    verify_parser.add_argument("files", nargs="+")
+    verify_parser.add_argument("--workers", type=int, default=None)
+    bench_parser = commands.add_parser("bench", help="measure verification throughput")
+    bench_parser.add_argument("--replays", type=int, default=1000)
+    bench_parser.add_argument("--difficulty", choices=("easy", "medium", "hard", "expert"), default="hard")
+    bench_parser.add_argument("--workers", type=int, default=None)
+    bench_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        return bench(args)
+    farm = VerificationFarm(args.workers).start()
+    try:
+        replays = []
+        for path in args.files:
+            with open(path, "rb") as f:
+                replays.append(f.read())
+        verdicts = farm.verify_many(replays)
+    finally:
+        farm.close()
+    for path, verdict in zip(args.files, verdicts):
+        print(f"{path}: {verdict}")
+    print(farm.report())
+    return 0 if all(v.accepted for v in verdicts) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())